@@ -1,19 +1,23 @@
 #!/usr/bin/python3
 
+import os
 import sys
 import logging
 import argparse
 import argcomplete
-import async_timeout
+import importlib
 
-from juju import jasyncio
+from jujuna.settings import DAEMON_SOCKET
 
-from jujuna.helper import log_traceback
 
-from jujuna.deploy import deploy  # noqa
-from jujuna.upgrade import upgrade  # noqa
-from jujuna.tests import test  # noqa
-from jujuna.clean import clean  # noqa
+# Actions are imported when executed, juju and brokers slow down help and shell completion
+ACTIONS = {
+    'deploy': ('jujuna.deploy', 'deploy'),
+    'upgrade': ('jujuna.upgrade', 'upgrade'),
+    'test': ('jujuna.tests', 'test'),
+    'clean': ('jujuna.clean', 'clean'),
+    'pipeline': ('jujuna.pipeline', 'pipeline'),
+}
 
 
 logger = logging.getLogger('jujuna')
@@ -88,6 +92,20 @@ def get_parser():
     p_upgrade.add_argument("--dry-run", action='store_true', dest="dry_run",
                            help="Dry run - only show changes without upgrading")
     p_upgrade.add_argument("-t", "--timeout", default=0, type=int, help="Timeout after N seconds.")
+    p_upgrade.add_argument("--lookup-concurrency", default=8, type=int, dest="lookup_concurrency",
+                           help="Query charmstore for up to N charms at once.")
+    p_upgrade.add_argument("--charmstore-ttl", default=600, type=int, dest="charmstore_ttl",
+                           help="Cache charmstore revisions on disk for N seconds (0 disables the cache).")
+    p_upgrade.add_argument("--parallel", default=1, type=int,
+                           help="Upgrade up to N independent applications at once (def: 1, listed order).")
+    p_upgrade.add_argument("--max-unavailable", "--batch-size", default=1, type=int, dest="max_unavailable",
+                           help="Upgrade up to N units of an application at once, after its leader (def: 1).")
+    p_upgrade.add_argument("--max-failures", default=None, type=int, dest="max_failures",
+                           help="Stop rolling upgrade when more than N units fail (def: unlimited).")
+    p_upgrade.add_argument("--wait-scope", default='related', choices=['app', 'related', 'model'], dest="wait_scope",
+                           help="Wait for the upgraded app, also related apps or whole model to settle (def: related).")
+    p_upgrade.add_argument("--resume", action='store_true',
+                           help="Skip steps finished by previous upgrade of the model to the same origin")
     p_upgrade.add_argument("-s", "--settings", type=argparse.FileType('r'),
                            help="Path to settings file that overrides default settings (i.e. settings.yaml)")
     p_upgrade.add_argument("--endpoint", default=None, dest="endpoint",
@@ -103,6 +121,22 @@ def get_parser():
     p_test.add_argument("-c", "--controller", default=None, dest="ctrl_name", help="Controller (def: current)")
     p_test.add_argument("-m", "--model", default=None, dest="model_name", help="Model to use instead of current")
     p_test.add_argument("-t", "--timeout", default=0, type=int, help="Timeout after N seconds.")
+    p_test.add_argument("--parallel", default=1, type=int, help="Test up to N units at once.")
+    p_test.add_argument("--parallel-app", default=0, type=int, dest="parallel_app",
+                        help="Test up to N units of one application at once (def: unlimited).")
+    p_test.add_argument("--parallel-machine", default=0, type=int, dest="parallel_machine",
+                        help="Test up to N units on one machine at once (def: unlimited).")
+    p_test.add_argument("--exporter-bundle", default=None, dest="exporter_bundle", choices=['unit', 'machine'],
+                        help="Upload all exporters as one bundle per unit or per machine.")
+    p_test.add_argument("--exporter-cache", action='store_true', dest="exporter_cache",
+                        help="Keep exporters on units and upload them only when changed.")
+    p_test.add_argument("--exporter-transport", default='scp', dest="exporter_transport", choices=['scp', 'inline'],
+                        help="Upload exporters using scp or pass them inline within the command (no ssh).")
+    p_test.add_argument("--no-machine-cache", action='store_false', dest="machine_cache",
+                        help="Collect machine level data for every unit instead of once per machine.")
+    p_test.add_argument("--profile", action='store_true', help="Log timing of brokers and their phases.")
+    p_test.add_argument("--profile-output", default=None, dest="profile_output",
+                        help="Write timing of brokers and their phases as JSON (i.e. profile.json)")
     p_test.add_argument("--endpoint", default=None, dest="endpoint",
                         help="Juju endpoint (requires model uuid instead of name)")
     p_test.add_argument("--username", default=None, dest="username", help="Juju username")
@@ -129,6 +163,37 @@ def get_parser():
     p_clean.add_argument("--cacert", default=None, dest="cacert", help="Juju CA certificate")
     p_clean.add_argument("--debug", action='store_true', help="Log level debug.")
 
+    p_pipeline = subparsers.add_parser(
+        'pipeline',
+        help="Run stages (deploy, upgrade, test, clean) of a job over one connection to the current or selected model"
+    )
+    p_pipeline.add_argument('job_file', type=argparse.FileType('r'), help="Path to job file (i.e. job.yaml)")
+    p_pipeline.add_argument("-c", "--controller", default=None, dest="ctrl_name", help="Controller (def: current)")
+    p_pipeline.add_argument("-m", "--model", default=None, dest="model_name", help="Model to use instead of current")
+    p_pipeline.add_argument("-t", "--timeout", default=0, type=int, help="Timeout after N seconds.")
+    p_pipeline.add_argument("--endpoint", default=None, dest="endpoint",
+                            help="Juju endpoint (requires model uuid instead of name)")
+    p_pipeline.add_argument("--username", default=None, dest="username", help="Juju username")
+    p_pipeline.add_argument("--password", default=None, dest="password", help="Juju password")
+    p_pipeline.add_argument("--cacert", default=None, dest="cacert", help="Juju CA certificate")
+    p_pipeline.add_argument("--debug", action='store_true', help="Log level debug.")
+
+    p_daemon = subparsers.add_parser(
+        'daemon',
+        help="Keep connections to the model open and run actions of clients attached over unix socket "
+             "(export JUJUNA_DAEMON=<socket>, requires Python 3.7+)"
+    )
+    p_daemon.add_argument("-c", "--controller", default=None, dest="ctrl_name", help="Controller (def: current)")
+    p_daemon.add_argument("-m", "--model", default=None, dest="model_name", help="Model to use instead of current")
+    p_daemon.add_argument("-s", "--socket", default=DAEMON_SOCKET, help="Unix socket (def: {})".format(DAEMON_SOCKET))
+    p_daemon.add_argument("-t", "--timeout", default=0, type=int, help="Timeout after N seconds.")
+    p_daemon.add_argument("--endpoint", default=None, dest="endpoint",
+                          help="Juju endpoint (requires model uuid instead of name)")
+    p_daemon.add_argument("--username", default=None, dest="username", help="Juju username")
+    p_daemon.add_argument("--password", default=None, dest="password", help="Juju password")
+    p_daemon.add_argument("--cacert", default=None, dest="cacert", help="Juju CA certificate")
+    p_daemon.add_argument("--debug", action='store_true', help="Log level debug.")
+
     argcomplete.autocomplete(parser)
 
     return parser
@@ -137,11 +202,22 @@ def get_parser():
 doc_arg_parser = get_parser()  # To be included in documentation
 
 
+def get_action(action):
+    """Import action function.
+
+    :param action: action name (see ACTIONS)
+    """
+    module, func = ACTIONS[action]
+    return getattr(importlib.import_module(module), func)
+
+
 async def run_action(action, timeout, args):
     """Run request action.
 
     """
-    selected_action = globals()[action]
+    import async_timeout
+
+    selected_action = get_action(action)
 
     if timeout == 0:
         return await selected_action(**args)
@@ -163,14 +239,8 @@ async def run_action(action, timeout, args):
 
 
 def load_kv_arg(args, item):
-    if args.get(item, False):
-        up_list = args[item].split(',')
-        upgrade_params = dict([
-            item.split('=') if '=' in item else [item, True] for item in up_list
-        ])
-        args[item] = upgrade_params
-    else:
-        args[item] = {}
+    from jujuna.helper import parse_kv
+    args[item] = parse_kv(args.get(item, False))
     return args
 
 
@@ -185,6 +255,7 @@ def parse_args(argv):
         args = load_kv_arg(args, 'upgrade_params')
         args = load_kv_arg(args, 'origin_keys')
     except Exception as e:
+        from jujuna.helper import log_traceback
         log_traceback(e)
         parser.print_help()
         sys.exit(1)
@@ -200,10 +271,19 @@ def parse_args(argv):
 def main():
     action, timeout, args = parse_args(sys.argv[1:])
 
+    from juju import jasyncio
+    from jujuna.helper import log_traceback
+    from jujuna.daemon import serve, attach
+
     try:
-        ret = jasyncio.run(
-            run_action(action, timeout, args)
-        )
+        if action == 'daemon':
+            ret = jasyncio.run(serve(run_action, formatter=logFormatter, **args))
+        elif os.environ.get('JUJUNA_DAEMON'):
+            ret = jasyncio.run(attach(os.environ['JUJUNA_DAEMON'], action, timeout, args))
+        else:
+            ret = jasyncio.run(
+                run_action(action, timeout, args)
+            )
     except Exception as e:
         log_traceback(e)
         ret = 1
@@ -1,13 +1,59 @@
 """Broker abstract class."""
 import json
+import shlex
+from types import MappingProxyType
+from jujuna.exporters import Exporter
+from jujuna.helper import get_unit_machine, SuiteError
+from jujuna.profiling import measure
 
 
 class Broker():
     """Broker abstract class."""
 
-    def __init__(self):
-        """Init abstract class."""
+    # Exporter collects data of the whole machine, results can be shared by units on the machine
+    machine_level = False
+
+    def __init__(self, exporter_options=None, results=None):
+        """Init abstract class.
+
+        :param exporter_options: dict of keyword arguments passed to exporters
+        :param results: ExporterResults shared by units on the same machine
+        """
         self.named = self.__class__.__name__.lower()
+        self.exporter_options = exporter_options if exporter_options else {}
+        self.results = results
+
+    @classmethod
+    def compile(cls, test_case):
+        """Validate test case and prepare immutable checks.
+
+        Called once per test suite, returned checks are passed to run for every unit.
+        """
+        return freeze(test_case)
+
+    def exporter(self, unit):
+        """Exporter context manager of the broker."""
+        return Exporter(unit, self.named, **self.exporter_options)
+
+    async def export(self, unit, args=[]):
+        """Run exporter on the unit and load its output.
+
+        Machine level exporters are executed once per machine if results are shared.
+        """
+        if self.results is not None and self.machine_level:
+            key = (get_unit_machine(unit), self.named, tuple(args))
+            return await self.results.get(key, lambda: self._export(unit, args))
+        return await self._export(unit, args)
+
+    async def _export(self, unit, args):
+        profiler = self.exporter_options.get('profiler')
+        async with self.exporter(unit) as exporter:
+            with measure(profiler, self.named, unit, 'run'):
+                act = await unit.run(python3(exporter, args=args), timeout=10)
+            if profiler:
+                profiler.record_action(self.named, unit.name, act.data)
+            with measure(profiler, self.named, unit, 'decode'):
+                return load_output(act.data['results'])
 
     async def run(self, *args, **kwargs):
         """Run method have to be overriden."""
@@ -15,9 +61,36 @@ class Broker():
         return []
 
 
+def freeze(value):
+    """Immutable copy of test case data (mappings and tuples)."""
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def expect_mapping(value, label, values=None):
+    """Validate that the value is a mapping, optionally with values of the given types."""
+    if not isinstance(value, dict):
+        raise SuiteError('{} has to be a mapping'.format(label))
+    if values is not None:
+        for key, item in value.items():
+            if not isinstance(item, values):
+                raise SuiteError('{}.{} has invalid value: {}'.format(label, key, item))
+    return value
+
+
+def expect_list(value, label):
+    """Validate that the value is a list."""
+    if not isinstance(value, (list, tuple)):
+        raise SuiteError('{} has to be a list'.format(label))
+    return value
+
+
 def python3(file, args=[]):
     if args:
-        return 'python3 {} {}'.format(file, ' '.join([str(arg) for arg in args]))
+        return 'python3 {} {}'.format(file, ' '.join([shlex.quote(str(arg)) for arg in args]))
     else:
         return 'python3 {}'.format(file)
 
@@ -5,6 +5,6 @@ from . import Broker
 class Api(Broker):
     """API broker."""
 
-    def __init__(self):
+    def __init__(self, exporter_options=None, results=None):
         """Init broker."""
-        super().__init__()
+        super().__init__(exporter_options, results)
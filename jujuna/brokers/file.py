@@ -1,6 +1,5 @@
 """File broker."""
-from . import Broker, python3, load_output
-from jujuna.exporters import Exporter
+from . import Broker, freeze, expect_mapping
 import logging
 
 
@@ -10,28 +9,40 @@ log = logging.getLogger('jujuna.tests.broker')
 class File(Broker):
     """File broker."""
 
-    def __init__(self):
+    def __init__(self, exporter_options=None, results=None):
         """Init broker."""
-        super().__init__()
+        super().__init__(exporter_options, results)
+
+    @classmethod
+    def compile(cls, test_case):
+        """Validate paths and their expected stats."""
+        return freeze(expect_mapping(test_case, 'file', values=dict))
 
     async def run(self, test_data, unit, idx):
-        """Run tests."""
+        """Run tests.
+
+        All paths (or glob patterns) of the unit are collected in a single exporter call.
+        Test of a glob pattern passes if it matches any path and all matching paths pass.
+        """
         rows = []
-        async with Exporter(unit, self.named) as exporter:
-            files = test_data
-            # print(test_data)
-
-            for file, params in files.items():
-                try:
-                    act = await unit.run(python3(exporter, args=[file]), timeout=10)
-                    results = load_output(act.data['results'])
-                except Exception as exc:
-                    log.debug(exc)
-                    results = {}
-                # print('Expect: ', files[file])
-                # print(results)
-                for param, value in params.items():
-                    res = (param in results) and (results[param] == value)
-                    rows.append((idx, '{}.{} == {}'.format(file, param, value), res), )
+        files = test_data
+        if not files:
+            return rows
+
+        try:
+            results = await self.export(unit, args=list(files.keys()))
+        except Exception as exc:
+            log.debug(exc)
+            results = {}
+
+        for file, params in files.items():
+            matches = results.get(file, {})
+            # print('Expect: ', files[file])
+            # print(matches)
+            for param, value in params.items():
+                res = bool(matches) and all(
+                    (param in stats) and (stats[param] == value) for stats in matches.values()
+                )
+                rows.append((idx, '{}.{} == {}'.format(file, param, value), res), )
 
         return rows
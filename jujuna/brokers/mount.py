@@ -1,6 +1,6 @@
 """Mount broker."""
-from . import Broker, python3, load_output
-from jujuna.exporters import Exporter
+from . import Broker, freeze, expect_mapping, expect_list
+from jujuna.helper import SuiteError
 import re
 import logging
 
@@ -11,33 +11,47 @@ log = logging.getLogger('jujuna.tests.broker')
 class Mount(Broker):
     """Mount broker."""
 
-    def __init__(self):
+    machine_level = True
+
+    def __init__(self, exporter_options=None, results=None):
         """Init broker."""
-        super().__init__()
+        super().__init__(exporter_options, results)
+
+    @classmethod
+    def compile(cls, test_case):
+        """Validate and precompile regular expressions of mounts."""
+        expect_mapping(test_case, 'mount')
+        checks = dict(test_case)
+        if 'regex' in checks:
+            expect_list(checks['regex'], 'mount.regex')
+            try:
+                checks['regex'] = [re.compile(str(condition)) for condition in checks['regex']]
+            except re.error as e:
+                raise SuiteError('mount.regex: {}'.format(e))
+        return freeze(checks)
 
     async def run(self, test_case, unit, idx):
         """Run tests."""
         rows = []
-        async with Exporter(unit, self.named) as exporter:
-            try:
-                act = await unit.run(python3(exporter), timeout=10)
-                results = load_output(act.data['results'])
-            except Exception as exc:
-                log.debug(exc)
-                results = []
-            # print(results.keys())
-            if 'regex' in test_case:
-                for condition in test_case['regex']:
-                    prog = re.compile(condition)
-                    mounts = ''
-
-                    for result in results:
-                        var = prog.search(result)
-                        if var:
-                            mounts = var.group(0)
-
-                    rows.append((idx, '{} == {}'.format(
-                        mounts if mounts else str(condition), 'mounted'
-                    ), True if mounts else False), )
+        try:
+            results = await self.export(unit)
+        except Exception as exc:
+            log.debug(exc)
+            results = []
+        # print(results.keys())
+        if 'regex' in test_case:
+            for condition in test_case['regex']:
+                # Precompiled by compile, raw strings are accepted as well
+                prog = re.compile(condition)
+                mounts = ''
+
+                for result in results:
+                    var = prog.search(result)
+                    if var:
+                        mounts = var.group(0)
+
+                rows.append((idx, '{} == {}'.format(
+                    mounts if mounts else prog.pattern, 'mounted'
+                ), True if mounts else False), )
 
         return rows
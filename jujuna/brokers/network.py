@@ -1,6 +1,5 @@
 """Network broker."""
-from . import Broker, python3, load_output
-from jujuna.exporters import Exporter
+from . import Broker, freeze, expect_mapping
 import logging
 
 
@@ -10,27 +9,35 @@ log = logging.getLogger('jujuna.tests.broker')
 class Network(Broker):
     """Network broker."""
 
-    def __init__(self):
+    machine_level = True
+
+    def __init__(self, exporter_options=None, results=None):
         """Init broker."""
-        super().__init__()
+        super().__init__(exporter_options, results)
+
+    @classmethod
+    def compile(cls, test_case):
+        """Validate ports and their expected state."""
+        expect_mapping(test_case, 'network')
+        if 'port' in test_case:
+            expect_mapping(test_case['port'], 'network.port', values=bool)
+        return freeze(test_case)
 
     async def run(self, test_case, unit, idx):
         """Run tests."""
         rows = []
-        async with Exporter(unit, self.named) as exporter:
-            if 'port' in test_case:
-                try:
-                    test_data = await unit.run(python3(exporter), timeout=10)
-                    results = load_output(test_data.data['results'])
-                except Exception as exc:
-                    log.debug(exc)
-                    results = {'sockets': []}
-                # print(results)
-
-                local_ports = [str(s['local_port']) for s in results['sockets']]
-
-                for port, open in test_case['port'].items():
-                    status = 'open' if open else 'closed'
-                    rows.append((idx, '{}.{} == {}'.format('port', port, status), (str(port) in local_ports) == open), )
+        if 'port' in test_case:
+            try:
+                results = await self.export(unit)
+            except Exception as exc:
+                log.debug(exc)
+                results = {'sockets': []}
+            # print(results)
+
+            local_ports = [str(s['local_port']) for s in results['sockets']]
+
+            for port, open in test_case['port'].items():
+                status = 'open' if open else 'closed'
+                rows.append((idx, '{}.{} == {}'.format('port', port, status), (str(port) in local_ports) == open), )
 
         return rows
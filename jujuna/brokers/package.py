@@ -1,6 +1,5 @@
 """Package broker."""
-from . import Broker, python3, load_output
-from jujuna.exporters import Exporter
+from . import Broker, freeze, expect_mapping, expect_list
 import logging
 
 
@@ -10,23 +9,36 @@ log = logging.getLogger('jujuna.tests.broker')
 class Package(Broker):
     """Mount broker."""
 
-    def __init__(self):
+    machine_level = True
+
+    def __init__(self, exporter_options=None, results=None):
         """Init broker."""
-        super().__init__()
+        super().__init__(exporter_options, results)
+
+    @classmethod
+    def compile(cls, test_case):
+        """Validate installed packages."""
+        expect_mapping(test_case, 'package')
+        if 'installed' in test_case:
+            expect_list(test_case['installed'], 'package.installed')
+        return freeze(test_case)
 
     async def run(self, test_case, unit, idx):
-        """Run tests."""
+        """Run tests.
+
+        Only packages listed in the test case are requested from the exporter.
+        """
         rows = []
-        async with Exporter(unit, self.named) as exporter:
-            try:
-                act = await unit.run(python3(exporter), timeout=10)
-                results = load_output(act.data['results'])
-            except Exception as exc:
-                log.debug(exc)
-                results = {'installed': []}
-            # print(results['installed'].keys())
-            if 'installed' in test_case:
-                for condition in test_case['installed']:
-                    rows.append((idx, '{} == {}'.format(condition, 'installed'), condition in results['installed']), )
+        if 'installed' not in test_case:
+            return rows
+
+        try:
+            results = await self.export(unit, args=list(test_case['installed']))
+        except Exception as exc:
+            log.debug(exc)
+            results = {'installed': []}
+        # print(results['installed'].keys())
+        for condition in test_case['installed']:
+            rows.append((idx, '{} == {}'.format(condition, 'installed'), condition in results['installed']), )
 
         return rows
@@ -1,6 +1,5 @@
 """Process broker."""
-from . import Broker, python3, load_output
-from jujuna.exporters import Exporter
+from . import Broker, freeze, expect_mapping
 import logging
 
 
@@ -10,23 +9,28 @@ log = logging.getLogger('jujuna.tests.broker')
 class Process(Broker):
     """Process broker."""
 
-    def __init__(self):
+    machine_level = True
+
+    def __init__(self, exporter_options=None, results=None):
         """Init Process broker."""
-        super().__init__()
+        super().__init__(exporter_options, results)
+
+    @classmethod
+    def compile(cls, test_case):
+        """Validate processes and their expected presence."""
+        return freeze(expect_mapping(test_case, 'process', values=bool))
 
     async def run(self, test_case, unit, idx):
         """Run tests."""
         rows = []
-        async with Exporter(unit, self.named) as exporter:
-            try:
-                act = await unit.run(python3(exporter), timeout=10)
-                results = load_output(act.data['results'])
-            except Exception as exc:
-                log.debug(exc)
-                results = {}
-            # print(results)
-            for condition, present in test_case.items():
-                status = 'present' if present else 'absent'
-                rows.append((idx, '{} == {}'.format(condition, status), (condition in results) == present), )
+        try:
+            results = await self.export(unit)
+        except Exception as exc:
+            log.debug(exc)
+            results = {}
+        # print(results)
+        for condition, present in test_case.items():
+            status = 'present' if present else 'absent'
+            rows.append((idx, '{} == {}'.format(condition, status), (condition in results) == present), )
 
         return rows
@@ -1,6 +1,5 @@
 """User broker."""
-from . import Broker, python3, load_output
-from jujuna.exporters import Exporter
+from . import Broker, freeze, expect_mapping
 import logging
 
 
@@ -10,28 +9,33 @@ log = logging.getLogger('jujuna.tests.broker')
 class User(Broker):
     """User broker."""
 
-    def __init__(self):
+    machine_level = True
+
+    def __init__(self, exporter_options=None, results=None):
         """Init User broker."""
-        super().__init__()
+        super().__init__(exporter_options, results)
+
+    @classmethod
+    def compile(cls, test_case):
+        """Validate users and their expected attributes."""
+        return freeze(expect_mapping(test_case, 'user', values=dict))
 
     async def run(self, test_case, unit, idx):
         """Run tests."""
         rows = []
-        async with Exporter(unit, self.named) as exporter:
-            try:
-                act = await unit.run(python3(exporter), timeout=10)
-                user_data = load_output(act.data['results'])
-            except Exception as exc:
-                log.debug(exc)
-                user_data = {}
-            # print(user_data)
-            for condition, test_item in test_case.items():
-                test_res = False
-                # if subitem in test_item.items():
-                if condition in user_data and all(
-                    user_data[condition][key] == value for key, value in test_item.items()
-                ):
-                    test_res = True
-                rows.append((idx, '{} == {}'.format(condition, 'present'), test_res), )
+        try:
+            user_data = await self.export(unit)
+        except Exception as exc:
+            log.debug(exc)
+            user_data = {}
+        # print(user_data)
+        for condition, test_item in test_case.items():
+            test_res = False
+            # if subitem in test_item.items():
+            if condition in user_data and all(
+                user_data[condition][key] == value for key, value in test_item.items()
+            ):
+                test_res = True
+            rows.append((idx, '{} == {}'.format(condition, 'present'), test_res), )
 
         return rows
@@ -4,9 +4,9 @@ import asyncio
 import websockets
 import logging
 from jujuna.helper import connect_juju, log_traceback
+from jujuna.wait import wait_for
 from juju.errors import JujuError
 from juju.client import client
-from juju import jasyncio
 
 
 # create logger
@@ -16,28 +16,23 @@ log = logging.getLogger('jujuna.clean')
 async def wait_until(model, *conditions, log_time=5, timeout=None, wait_period=0.5, loop=None):
     """Return only after all conditions are true.
 
+    Conditions are evaluated on changes of applications and machines in the model.
     """
-    log_count = 0
-
-    if not loop:
-        loop = jasyncio.get_running_loop()
-
-    def _disconnected():
-        return not (model.is_connected() and model.connection().is_open)
-
-    async def _block(log_count):
-        while not _disconnected() and not all(c() for c in conditions):
-            await asyncio.sleep(wait_period, loop=loop)
-            log_count += 0.5
-            if log_count % log_time == 0:
-                log.info('[RUNNING] Machines: {} {} Apps: {}'.format(
-                    len(model.machines),
-                    ', '.join(model.machines.keys()),
-                    len(model.applications)
-                ))
-    await asyncio.wait_for(_block(log_count), timeout, loop=loop)
-
-    if _disconnected():
+    def _log():
+        log.info('[RUNNING] Machines: {} {} Apps: {}'.format(
+            len(model.machines),
+            ', '.join(model.machines.keys()),
+            len(model.applications)
+        ))
+
+    connected = await asyncio.wait_for(wait_for(
+        model, lambda: all(c() for c in conditions),
+        entity_types=['application', 'machine'],
+        log_time=log_time,
+        log_func=_log,
+    ), timeout)
+
+    if not connected:
         raise websockets.ConnectionClosed(1006, 'no reason')
 
     log.info('[DONE] Machines: {} Apps: {}'.format(
@@ -0,0 +1,216 @@
+import io
+import os
+import sys
+import json
+import asyncio
+import logging
+
+from jujuna.helper import connect_juju, share_connections, close_connections, log_traceback
+from jujuna.settings import DAEMON_SOCKET
+
+
+try:
+    import contextvars
+except ImportError:
+    # Python < 3.7, daemon is not available
+    contextvars = None
+
+
+log = logging.getLogger('jujuna.daemon')
+
+# Request served by the current task, used to route log records to its client
+_request = contextvars.ContextVar('request', default=None) if contextvars else None
+
+# Actions changing the model run one at a time per model
+EXCLUSIVE_ACTIONS = ['deploy', 'upgrade', 'clean', 'pipeline']
+
+
+class ClientHandler(logging.Handler):
+    """Stream log records of a request to its client."""
+
+    def __init__(self, request, writer, level=logging.INFO):
+        super().__init__(level)
+        self.request = request
+        self.writer = writer
+
+    def filter(self, record):
+        return _request.get() is self.request and super().filter(record)
+
+    def emit(self, record):
+        try:
+            send(self.writer, {'log': self.format(record)})
+        except Exception:
+            self.handleError(record)
+
+
+def send(writer, message):
+    writer.write(json.dumps(message).encode() + b'\n')
+
+
+def encode_args(args):
+    """Replace open files in arguments with their absolute paths."""
+    return {
+        key: {'file': os.path.abspath(value.name)} if isinstance(value, io.IOBase) else value
+        for key, value in args.items()
+    }
+
+
+def decode_args(args):
+    """Open files passed by path."""
+    return {
+        key: open(value['file'], 'r') if isinstance(value, dict) and list(value) == ['file'] else value
+        for key, value in args.items()
+    }
+
+
+async def serve(
+    run_action,
+    socket=DAEMON_SOCKET,
+    formatter=None,
+    ctrl_name=None,
+    model_name=None,
+    endpoint='',
+    username='',
+    password='',
+    cacert='',
+    debug=False,
+    **kwargs
+):
+    """Serve actions over unix socket using shared connections.
+
+    Controller and model connections stay open between actions (connect_juju returns shared connections),
+    so the model state is already synchronized when the action starts.
+    Actions of clients run concurrently, except actions changing the model (EXCLUSIVE_ACTIONS)
+    which wait for each other per model.
+    Logs are routed to clients with context variables, the daemon requires Python 3.7+.
+
+    :param run_action: coroutine function running action (action, timeout, args)
+    :param socket: unix socket path
+    :param formatter: log formatter of records sent to clients
+    :param ctrl_name: juju controller connected in advance
+    :param model_name: juju model connected in advance
+    """
+    if contextvars is None:
+        log.error('Daemon requires Python 3.7 or newer')
+        return 1
+
+    path = os.path.expanduser(socket)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path):
+        os.unlink(path)
+
+    share_connections()
+    try:
+        await connect_juju(
+            ctrl_name, model_name, endpoint=endpoint, username=username, password=password, cacert=cacert
+        )
+        log.info('Connected to model {}'.format(model_name if model_name else '(current)'))
+    except Exception as e:
+        log.warning('Unable to connect in advance: {}'.format(e))
+
+    # Client handlers filter records by level of the request
+    jujuna_log = logging.getLogger('jujuna')
+    jujuna_log.setLevel(logging.DEBUG)
+
+    locks = {}
+
+    async def _run(action, timeout, args):
+        if action not in EXCLUSIVE_ACTIONS:
+            return await run_action(action, timeout, args)
+        key = tuple(args.get(name) or default for name, default in [
+            ('ctrl_name', ctrl_name), ('model_name', model_name), ('endpoint', endpoint)
+        ])
+        lock = locks.setdefault(key, asyncio.Lock())
+        if lock.locked():
+            log.info('Waiting for running action changing model {}'.format(key[1] or '(current)'))
+        async with lock:
+            return await run_action(action, timeout, args)
+
+    async def _handle(reader, writer):
+        try:
+            request = json.loads((await reader.readline()).decode())
+        except ValueError:
+            writer.close()
+            return
+        _request.set(request)
+        handler = ClientHandler(request, writer, logging.DEBUG if request['args'].get('debug') else logging.INFO)
+        if formatter:
+            handler.setFormatter(formatter)
+        jujuna_log.addHandler(handler)
+        log.info('Running action {} for client'.format(request['action']))
+
+        args = decode_args(request['args'])
+        action = asyncio.ensure_future(_run(request['action'], request['timeout'], args))
+        # Client closing the connection cancels the action
+        closed = asyncio.ensure_future(reader.read())
+        try:
+            await asyncio.wait([action, closed], return_when=asyncio.FIRST_COMPLETED)
+            if not action.done():
+                log.warning('Client detached, cancelling action {}'.format(request['action']))
+                action.cancel()
+            try:
+                ret = await action
+            except asyncio.CancelledError:
+                ret = 130
+            except Exception as e:
+                log_traceback(e)
+                ret = 1
+            send(writer, {'exit': ret})
+            await writer.drain()
+        except (IOError, OSError):
+            pass
+        finally:
+            closed.cancel()
+            jujuna_log.removeHandler(handler)
+            for value in args.values():
+                if isinstance(value, io.IOBase):
+                    value.close()
+            writer.close()
+
+    # Socket grants access to the connections, only the owner can attach
+    old_umask = os.umask(0o077)
+    try:
+        server = await asyncio.start_unix_server(_handle, path=path)
+    finally:
+        os.umask(old_umask)
+    log.info('Listening on {}, attach with: export JUJUNA_DAEMON={}'.format(path, path))
+    try:
+        await asyncio.Event().wait()
+    finally:
+        server.close()
+        await server.wait_closed()
+        await close_connections()
+        if os.path.exists(path):
+            os.unlink(path)
+    return 0
+
+
+async def attach(socket, action, timeout, args):
+    """Run action in the daemon and print its logs.
+
+    :param socket: unix socket path
+    :param action: action name
+    :param timeout: action timeout (s)
+    :param args: action arguments
+    :return int: exit code of the action
+    """
+    reader, writer = await asyncio.open_unix_connection(os.path.expanduser(socket))
+    send(writer, {'action': action, 'timeout': timeout, 'args': encode_args(args)})
+    await writer.drain()
+    ret = 1
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                log.error('Daemon closed the connection')
+                break
+            message = json.loads(line.decode())
+            if 'log' in message:
+                sys.stdout.write(message['log'] + '\n')
+                sys.stdout.flush()
+            if 'exit' in message:
+                ret = message['exit']
+                break
+    finally:
+        writer.close()
+    return ret
@@ -1,37 +1,172 @@
 """Exporter management."""
 
 import os
+import zlib
 import uuid
+import shlex
+import base64
+import atexit
+import hashlib
+import asyncio
 import logging
+import zipfile
+import tempfile
 import async_timeout
 
+from jujuna.helper import get_unit_machine
+from jujuna.profiling import measure
+
 
 log = logging.getLogger('jujuna.tests.exporter')
 
+# Persistent exporters are stored on units by content hash e.g. /var/lib/jujuna/file/<hash>.py
+# Exporters are executed as root, the cache is used only if owned by root and not accessible by others
+CACHE_DIR = '/var/lib/jujuna'
+
+# Cache directory owner and mode (stat -c %u:%a)
+CACHE_OWNER = '0:700'
+
+BUNDLE_MAIN = """import sys
+import runpy
+
+if len(sys.argv) < 2:
+    raise SystemExit('Specify exporter name.')
+runpy.run_module(sys.argv.pop(1), run_name='__main__', alter_sys=True)
+"""
+
+INLINE_LOADER = 'import base64,zlib;exec(compile(zlib.decompress(base64.b64decode("{}")),"{}","exec"))'
+
+_bundle_local = None
+_inline_payloads = {}
+
+
+def build_bundle():
+    """Build zipapp with all exporters.
+
+    Exporter is selected by the first argument e.g. python3 jujuna.pyz file /etc/hosts.
+    Bundle is built once and removed on exit.
+
+    :return string: local path to the bundle
+    """
+    global _bundle_local
+    if _bundle_local is None:
+        full_path = os.path.dirname(os.path.realpath(__file__))
+        handle, bundle_path = tempfile.mkstemp(prefix='jujuna', suffix='.pyz')
+        with os.fdopen(handle, 'wb') as stream:
+            with zipfile.ZipFile(stream, 'w') as bundle:
+                # Fixed timestamps keep the content of the bundle reproducible
+                bundle.writestr(zipfile.ZipInfo('__main__.py'), BUNDLE_MAIN, zipfile.ZIP_DEFLATED)
+                for name in sorted(os.listdir(full_path)):
+                    if name.endswith('.py') and name != '__init__.py':
+                        with open(os.path.join(full_path, name), 'r') as source:
+                            bundle.writestr(zipfile.ZipInfo(name), source.read(), zipfile.ZIP_DEFLATED)
+        atexit.register(os.remove, bundle_path)
+        _bundle_local = bundle_path
+    return _bundle_local
+
+
+def inline_exporter(path):
+    """Python options running exporter source passed in the command.
+
+    Source is compressed and base64 encoded e.g. python3 -c '<loader>' /etc/hosts.
+
+    :param path: local path to the exporter
+    :return string: python3 options
+    """
+    if path not in _inline_payloads:
+        with open(path, 'rb') as stream:
+            payload = base64.b64encode(zlib.compress(stream.read(), 9)).decode('ascii')
+        _inline_payloads[path] = '-c {}'.format(shlex.quote(
+            INLINE_LOADER.format(payload, os.path.basename(path))
+        ))
+    return _inline_payloads[path]
+
+
+def file_digest(path, length=16):
+    """Content hash (sha256) of a local file.
+
+    :param path: local path
+    :param length: length of the hex digest, full digest if None
+    """
+    with open(path, 'rb') as stream:
+        return hashlib.sha256(stream.read()).hexdigest()[:length]
+
 
 class Exporter():
     """Exporter context manager."""
 
-    def __init__(self, unit, exporter_name, timeout=15):
-        """Init exporter."""
+    extension = '.py'
+
+    def __init__(
+        self, unit, exporter_name, timeout=15, bundles=None, persistent=False, transport='scp', profiler=None
+    ):
+        """Init exporter.
+
+        :param unit: juju unit
+        :param exporter_name: name of the exporter module
+        :param timeout: upload and cleanup timeout (s)
+        :param bundles: ExporterBundles providing uploaded bundle instead of uploading the exporter
+        :param persistent: keep exporter on the unit in the cache keyed by content hash
+        :param transport: scp uploads the exporter, inline passes the source within the command
+        :param profiler: Profiler recording upload and cleanup time
+        """
+        if transport not in ['scp', 'inline']:
+            raise Exception('Unknown exporter transport: {}'.format(transport))
         if exporter_name.endswith('.py'):
             raise Exception('Do not provide an extension')
         self.timeout = timeout
         self.unit = unit
+        self.bundles = bundles
+        self.persistent = persistent
+        self.transport = transport
+        self.profiler = profiler
+        self.exporter_name = exporter_name
         self.full_path = os.path.dirname(os.path.realpath(__file__))
-        self.exporter_local = os.path.join(self.full_path, exporter_name + '.py')
-        if not os.path.isfile(self.exporter_local):
-            raise Exception('Exporter: {}.py not found'.format(exporter_name))
-        self.exporter_remote = os.path.join('/tmp', str(uuid.uuid4())[:9] + exporter_name + '.py')
+        self.exporter_local = self._local_path(exporter_name)
+        self.exporter_remote = self._remote_path(exporter_name, self.extension)
+
+    def _local_path(self, name):
+        """Local path of the exporter."""
+        path = os.path.join(self.full_path, name + '.py')
+        if not os.path.isfile(path):
+            raise Exception('Exporter: {}.py not found'.format(name))
+        return path
+
+    def _remote_path(self, name, extension):
+        """Remote path of the exporter, unique for every upload unless persistent."""
+        if self.persistent:
+            return os.path.join(CACHE_DIR, name, file_digest(self.exporter_local) + extension)
+        return os.path.join('/tmp', str(uuid.uuid4())[:9] + name + extension)
 
     async def __aenter__(self):
         """Upload exporter and return remote path."""
+        with measure(self.profiler, self.exporter_name, self.unit, 'upload'):
+            return await self._enter()
+
+    async def __aexit__(self, type, value, traceback):
+        """Dispose remote exporter."""
+        with measure(self.profiler, self.exporter_name, self.unit, 'cleanup'):
+            await self._exit()
+
+    async def _enter(self):
+        if self.transport == 'inline':
+            return inline_exporter(self.exporter_local)
+        if self.bundles:
+            bundle_remote = await self.bundles.get(self.unit)
+            return '{} {}'.format(bundle_remote, self.exporter_name)
         # print('Load: ', self.exporter_local)
+        if self.persistent:
+            if await self._cache_exporter(self.unit, self.exporter_local, self.exporter_remote):
+                return self.exporter_remote
+            # Exporter is uploaded for this run only if the cache is not usable
+            self.persistent = False
+            self.exporter_remote = self._remote_path(self.exporter_name, self.extension)
         await self._load_exporter(self.unit, self.exporter_local, self.exporter_remote)
         return self.exporter_remote
 
-    async def __aexit__(self, type, value, traceback):
-        """Dispose remote exporter."""
+    async def _exit(self):
+        if self.transport == 'inline' or self.bundles or self.persistent:
+            return
         # print('Unload: ', self.exporter_remote)
         await self._unload_exporter(self.unit, self.exporter_remote)
 
@@ -49,6 +184,57 @@ class Exporter():
             except Exception as exc:
                 log.debug(exc)
 
+    async def _cache_exporter(self, unit, source, target, user='ubuntu'):
+        """Upload exporter into the cache on the unit unless already present.
+
+        Cache directory has to be owned by root with mode 0700 and content of the cached
+        exporter is verified (sha256sum), both with a single command. After upload, other versions
+        of the exporter are removed from the cache.
+
+        :return boolean: True if the exporter is cached
+        """
+        cache_check = 'test -d {cache} && test ! -L {cache} && test "$(stat -c %u:%a {cache})" = {owner}'.format(
+            cache=CACHE_DIR, owner=CACHE_OWNER
+        )
+        content_check = 'echo "{}  {}" | sha256sum -c --status'.format(file_digest(source, length=None), target)
+        try:
+            async with async_timeout.timeout(self.timeout):
+                ret = await unit.run(
+                    '{} && {} && echo present || echo missing'.format(cache_check, content_check),
+                    timeout=self.timeout - 1
+                )
+            if ret.data['results']['Stdout'].strip() == 'present':
+                return True
+        except Exception as exc:
+            log.debug(exc)
+
+        # Upload as user is possible only to a writable location, moved into the cache as root
+        upload = os.path.join('/tmp', str(uuid.uuid4())[:9] + os.path.basename(target))
+        await self._load_exporter(unit, source, upload, user=user)
+        ret = None
+        for i in range(3):
+            try:
+                async with async_timeout.timeout(self.timeout):
+                    ret = await unit.run(
+                        'umask 077 && mkdir -p {cache} && {cache_check} && mkdir -p {dir} && mv {upload} {target} && '
+                        'chown root:root {target} && ({content_check} || (rm -f {target}; false)) && '
+                        'find {dir} -type f ! -name {name} -delete'.format(
+                            cache=CACHE_DIR, cache_check=cache_check, content_check=content_check,
+                            dir=os.path.dirname(target), upload=upload, target=target, name=os.path.basename(target)
+                        ),
+                        timeout=self.timeout - 1
+                    )
+                break
+            except Exception as exc:
+                log.debug(exc)
+        if ret and ret.data and 'results' in ret.data and ret.data['results']['Code'] == '0':
+            return True
+        log.warning('Cache failed: {}'.format(
+            ret.data['results']['Stderr'] if ret and ret.data and 'results' in ret.data else 'no response'
+        ))
+        await self._unload_exporter(unit, upload)
+        return False
+
     async def _unload_exporter(self, unit, target, user='ubuntu'):
         """Dispose of remote exporter."""
         ret = None
@@ -70,3 +256,91 @@ class Exporter():
             'No such file' not in ret.data['results']['Stderr']
         ):
             log.warn('Unload failed: {}'.format(ret.data['results']['Stderr']))
+
+
+class ExporterBundle(Exporter):
+    """Exporter bundle context manager.
+
+    Uploads all exporters at once as a single zipapp.
+    """
+
+    extension = '.pyz'
+
+    def __init__(self, unit, timeout=15, persistent=False):
+        """Init exporter bundle."""
+        super().__init__(unit, 'jujuna', timeout=timeout, persistent=persistent)
+
+    def _local_path(self, name):
+        """Local path of the bundle (built once)."""
+        return build_bundle()
+
+
+class ExporterBundles():
+    """Exporter bundles shared by units.
+
+    Bundle is uploaded once per unit or once per machine (mode) when first requested
+    and removed when closed.
+    """
+
+    def __init__(self, mode='unit', timeout=15, persistent=False):
+        """Init exporter bundles.
+
+        :param mode: unit or machine
+        :param timeout: upload and cleanup timeout (s)
+        :param persistent: keep bundle on the unit in the cache keyed by content hash
+        """
+        if mode not in ['unit', 'machine']:
+            raise Exception('Unknown bundle mode: {}'.format(mode))
+        self.mode = mode
+        self.timeout = timeout
+        self.persistent = persistent
+        self.bundles = {}
+
+    async def get(self, unit):
+        """Upload bundle if not present and return remote path."""
+        key = get_unit_machine(unit) if self.mode == 'machine' else unit.name
+        if key not in self.bundles:
+            bundle = ExporterBundle(unit, timeout=self.timeout, persistent=self.persistent)
+            self.bundles[key] = (bundle, asyncio.ensure_future(bundle.__aenter__()))
+        # Shielded as upload is shared by other units on the same machine
+        return await asyncio.shield(self.bundles[key][1])
+
+    async def close(self):
+        """Remove uploaded bundles."""
+        bundles, self.bundles = self.bundles, {}
+        for bundle, upload in bundles.values():
+            if not upload.done():
+                upload.cancel()
+            elif not upload.cancelled():
+                await bundle.__aexit__(None, None, None)
+
+
+class ExporterResults():
+    """Exporter results shared within a test run.
+
+    Results are stored by key (e.g. machine, exporter and arguments) and exporter
+    is executed only once, concurrent requests wait for the same execution.
+    Failed executions are not stored, requests waiting for them retry with their own export.
+    """
+
+    def __init__(self):
+        """Init exporter results."""
+        self.results = {}
+
+    async def get(self, key, export):
+        """Return stored result or execute export coroutine function."""
+        while True:
+            own = key not in self.results
+            if own:
+                self.results[key] = asyncio.ensure_future(export())
+            result = self.results[key]
+            try:
+                # Shielded as execution is shared by other units on the same machine
+                return await asyncio.shield(result)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                if self.results.get(key) is result:
+                    del self.results[key]
+                if own:
+                    raise
@@ -1,21 +1,16 @@
 #!/usr/bin/env python3
 
 import json
+import glob
 import sys
 import os
 import stat
 
 
-def main():
-    if len(sys.argv) != 2:
-        raise Exception('Specify exactly one filepath.')
-    filepath = sys.argv[1]
-    if not os.path.exists(filepath):
-        raise Exception("Path '{}' does not exist.".format(filepath))
-
+def file_vars(filepath):
     file_stat = os.stat(filepath)
 
-    file_vars = {
+    return {
         'st_mode': file_stat.st_mode,
         'st_ino': file_stat.st_ino,
         'st_dev': file_stat.st_dev,
@@ -37,7 +32,23 @@ def main():
         'ifmt': stat.S_IFMT(file_stat.st_mode),
     }
 
-    print(json.dumps(file_vars))
+
+def main():
+    if len(sys.argv) < 2:
+        raise Exception('Specify at least one filepath.')
+
+    # Map of requested paths or glob patterns to stats of existing matching paths
+    files = {}
+    for pattern in sys.argv[1:]:
+        if any(char in pattern for char in '*?['):
+            paths = sorted(glob.glob(pattern))
+        else:
+            paths = [pattern]
+        files[pattern] = {
+            path: file_vars(path) for path in paths if os.path.exists(path)
+        }
+
+    print(json.dumps(files))
     sys.exit(0)
 
 
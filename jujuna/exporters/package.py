@@ -2,22 +2,73 @@
 
 import json
 import sys
-import apt
+import itertools
 
+DPKG_STATUS = '/var/lib/dpkg/status'
+
+
+def dpkg_installed(names, path=DPKG_STATUS):
+    """Installed packages from dpkg status file, limited to requested names.
+
+    Names can be qualified by architecture e.g. libc6:amd64.
+    """
+    wanted = set(names)
+    installed = {}
+    package = {}
+    with open(path, 'r', encoding='utf-8', errors='replace') as status_file:
+        # Trailing empty line closes the last paragraph
+        for line in itertools.chain(status_file, ['\n']):
+            if line.startswith('Package:'):
+                package['name'] = line[8:].strip()
+            elif line.startswith('Status:'):
+                package['status'] = line[7:].split()
+            elif line.startswith('Version:'):
+                package['version'] = line[8:].strip()
+            elif line.startswith('Architecture:'):
+                package['architecture'] = line[13:].strip()
+            elif not line.strip():
+                name = package.get('name')
+                if name and package.get('status', [])[-1:] == ['installed']:
+                    fullname = '{}:{}'.format(name, package.get('architecture', ''))
+                    for key in [name, fullname]:
+                        if key in wanted:
+                            installed[key] = {
+                                'name': fullname,
+                                'shortname': name,
+                                'versions': [package.get('version', '')],
+                            }
+                package = {}
+    return installed
 
-def main():
-    pkg_data = {}
+
+def apt_installed(names=None):
+    """Installed packages from apt cache, optionally limited to requested names."""
+    import apt
 
     cache = apt.Cache()
     installed = {}
-    for mypkg in apt.Cache():
-        if cache[mypkg.name].is_installed:
+    for mypkg in cache:
+        if (names is None or mypkg.name in names) and cache[mypkg.name].is_installed:
             installed[mypkg.name] = {
                 'id': mypkg.id,
                 'name': mypkg.name,
                 'shortname': mypkg.shortname,
                 'versions': list(dict(mypkg.versions).keys())
             }
+    return installed
+
+
+def main():
+    # Without arguments all installed packages are exported
+    names = sys.argv[1:]
+
+    if names:
+        try:
+            installed = dpkg_installed(names)
+        except (IOError, OSError):
+            installed = apt_installed(names)
+    else:
+        installed = apt_installed()
 
     pkg_data = {
         'installed': installed
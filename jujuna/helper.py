@@ -1,18 +1,27 @@
+import os
+import re
+import json
+import time
+import yaml
 import asyncio
 import logging
 import traceback
+from datetime import datetime, timedelta, timezone
 from collections import Counter
 from websockets import ConnectionClosed
 
-from jujuna.settings import MAX_FRAME_SIZE
+from jujuna.settings import MAX_FRAME_SIZE, CHARMSTORE_CACHE, UPGRADE_JOURNAL
+from jujuna.wait import wait_for, model_status
 
 from juju.controller import Controller
 from juju.model import Model
-from juju import jasyncio
 
 from theblues.charmstore import CharmStore
 
 
+log = logging.getLogger('jujuna.helper')
+
+
 class ApperrorTimeout(Exception):
     """Raised when an application stays too long in error state."""
 
@@ -20,6 +29,60 @@ class ApperrorTimeout(Exception):
         self.message = 'Timed out with application in error state'
 
 
+class SuiteError(Exception):
+    """Raised when a test suite is not valid."""
+
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+
+def load_yaml(stream):
+    """Load yaml document.
+
+    Uses libyaml based loader when available, which is considerably faster on large files.
+
+    :param stream: file object or string
+    """
+    loader = getattr(yaml, 'CFullLoader', None) or getattr(yaml, 'FullLoader', None) or yaml.Loader
+    return yaml.load(stream, Loader=loader)
+
+
+def parse_time(value):
+    """Parse juju timestamp (RFC 3339, e.g. 2020-02-07T10:15:03.123456789+01:00) to epoch seconds.
+
+    Timestamps without timezone are considered UTC.
+
+    :param value: timestamp string
+    :return float: seconds since epoch, None if value is not a timestamp
+    """
+    match = re.match(
+        r'(\d{4}-\d\d-\d\d)[T ](\d\d:\d\d:\d\d)(\.\d+)?\s*(Z|[+-]\d\d:?\d\d)?$', str(value).strip()
+    )
+    if not match:
+        return None
+    parsed = datetime.strptime('{}T{}'.format(match.group(1), match.group(2)), '%Y-%m-%dT%H:%M:%S')
+    offset = match.group(4)
+    if offset and offset != 'Z':
+        digits = offset[1:].replace(':', '')
+        delta = timedelta(hours=int(digits[:2]), minutes=int(digits[2:]))
+        parsed = parsed.replace(tzinfo=timezone(-delta if offset[0] == '-' else delta))
+    else:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp() + float(match.group(3) or 0)
+
+
+def parse_kv(value):
+    """Parse comma separated key=value pairs, keys without value are True.
+
+    :param value: string e.g. 'service=name,version=2'
+    :return dict: parsed pairs, empty if value is not set
+    """
+    if not value:
+        return {}
+    return dict([item.split('=') if '=' in item else [item, True] for item in value.split(',')])
+
+
 def log_traceback(ex, prefix=''):
     if prefix and isinstance(prefix, str):
         prefix = '{} - '.format(prefix.strip())
@@ -64,7 +127,183 @@ def cs_name_parse(name, series=None):
         }
 
 
+def get_unit_machine(unit):
+    """Get machine identifier of the unit.
+
+    Subordinate units may not provide machine id, public address is used instead
+    as it is shared with the principal unit.
+
+    :param unit: juju unit
+    :return string: machine id, public address or unit name
+    """
+    data = unit.safe_data
+    return data.get('machine-id') or data.get('public-address') or unit.name
+
+
+class CharmstoreCache():
+    """Charmstore entity ids cached on disk with time to live.
+
+    Avoids repeated charmstore queries during dry runs and re-runs of upgrades.
+    """
+
+    def __init__(self, path=CHARMSTORE_CACHE, ttl=600):
+        """Init cache.
+
+        :param path: cache file
+        :param ttl: time to live of cached entries (s), 0 disables the cache
+        """
+        self.path = os.path.expanduser(path)
+        self.ttl = ttl
+        self.entries = None
+
+    def _load(self):
+        if self.entries is None:
+            try:
+                with open(self.path, 'r') as stream:
+                    self.entries = json.load(stream)
+            except (IOError, OSError, ValueError):
+                self.entries = {}
+        return self.entries
+
+    def get(self, charm):
+        """Return cached entity id of the charm if not expired."""
+        if not self.ttl:
+            return None
+        entry = self._load().get(charm)
+        if entry and time.time() - entry['time'] < self.ttl:
+            return entry['id']
+        return None
+
+    def set(self, charm, entity_id):
+        """Store entity id of the charm."""
+        if self.ttl:
+            self._load()[charm] = {'id': entity_id, 'time': time.time()}
+
+    def save(self):
+        """Write cache file."""
+        if not self.ttl or self.entries is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = '{}.tmp'.format(self.path)
+            with open(tmp_path, 'w') as stream:
+                json.dump(self.entries, stream)
+            os.replace(tmp_path, self.path)
+        except (IOError, OSError) as e:
+            log.warning('Failed to save charmstore cache: {}'.format(e))
+
+
+class UpgradeJournal():
+    """Completed upgrade steps recorded on disk.
+
+    Journal is keyed by model uuid and target origin, steps finished by a previous
+    (failed) run are skipped when resuming.
+    """
+
+    def __init__(self, model_uuid, origin, resume=False, path=UPGRADE_JOURNAL):
+        """Init journal.
+
+        :param model_uuid: juju model uuid
+        :param origin: target origin string
+        :param resume: boolean, load steps of the previous run
+        :param path: journal file (formatted with model and origin)
+        """
+        self.path = os.path.expanduser(path.format(
+            model=model_uuid, origin=''.join(c if c.isalnum() or c in '-.' else '_' for c in origin or 'none')
+        ))
+        self.steps = set()
+        if resume:
+            try:
+                with open(self.path, 'r') as stream:
+                    self.steps = set(json.load(stream).get('steps', []))
+                log.info('Resuming upgrade, {} finished steps in journal {}'.format(len(self.steps), self.path))
+            except (IOError, OSError, ValueError):
+                log.warning('Unable to load upgrade journal: {}'.format(self.path))
+
+    def done(self, kind, name):
+        """Whether the step (e.g. charm, config, unit, app) was finished."""
+        return '{}:{}'.format(kind, name) in self.steps
+
+    def record(self, kind, name):
+        """Record finished step and write the journal."""
+        self.steps.add('{}:{}'.format(kind, name))
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = '{}.tmp'.format(self.path)
+            with open(tmp_path, 'w') as stream:
+                json.dump({'steps': sorted(self.steps)}, stream)
+            os.replace(tmp_path, self.path)
+        except (IOError, OSError) as e:
+            log.warning('Failed to save upgrade journal: {}'.format(e))
+
+
+class SharedConnection():
+    """Controller or model connection shared between actions (see share_connections).
+
+    Disconnect is ignored, the connection is closed by close_connections.
+    """
+
+    def __init__(self, target):
+        """Init shared connection.
+
+        :param target: juju controller or model
+        """
+        self.target = target
+
+    def __getattr__(self, name):
+        return getattr(self.target, name)
+
+    async def disconnect(self):
+        pass
+
+
+_shared_connections = None
+
+
+def share_connections():
+    """Keep connections of connect_juju open and reuse them (daemon mode).
+
+    :return boolean: True if sharing was enabled by this call
+    """
+    global _shared_connections
+    if _shared_connections is None:
+        _shared_connections = {'lock': asyncio.Lock(), 'connections': {}}
+        return True
+    return False
+
+
+async def close_connections():
+    """Disconnect shared connections."""
+    global _shared_connections
+    if _shared_connections is None:
+        return
+    connections, _shared_connections = _shared_connections['connections'], None
+    for controller, model in connections.values():
+        await model.target.disconnect()
+        await controller.target.disconnect()
+
+
 async def connect_juju(ctrl_name=None, model_name=None, endpoint=None, username=None, password=None, cacert=None):
+    """Connect to juju controller and model.
+
+    Shared connections are returned if enabled (see share_connections),
+    model state is kept up to date by the open connection.
+    """
+    if _shared_connections is not None:
+        key = (ctrl_name, model_name, endpoint, username)
+        async with _shared_connections['lock']:
+            connection = _shared_connections['connections'].get(key)
+            if connection is None or not connection[1].is_connected():
+                if connection is not None:
+                    log.warning('Shared connection to model {} was closed, reconnecting'.format(model_name))
+                controller, model = await _connect_juju(ctrl_name, model_name, endpoint, username, password, cacert)
+                connection = (SharedConnection(controller), SharedConnection(model))
+                _shared_connections['connections'][key] = connection
+        return connection
+    return await _connect_juju(ctrl_name, model_name, endpoint, username, password, cacert)
+
+
+async def _connect_juju(ctrl_name=None, model_name=None, endpoint=None, username=None, password=None, cacert=None):
     controller = Controller(max_frame_size=MAX_FRAME_SIZE)  # noqa
 
     if endpoint:
@@ -90,7 +329,8 @@ async def connect_juju(ctrl_name=None, model_name=None, endpoint=None, username=
 async def wait_until(model, apps, logger, log_time=5, timeout=None, wait_period=0.5, error_timeout=None, loop=None):
     """Blocking with log messages.
 
-    Return only after all conditions are true.
+    Return only after all conditions are true. Conditions are evaluated on changes
+    of applications and units in the model and have to stay true for 10 seconds.
 
     :param model: juju model
     :param apps: juju application
@@ -98,73 +338,62 @@ async def wait_until(model, apps, logger, log_time=5, timeout=None, wait_period=
     :param log_time: logging frequency (s)
     :param timeout: blocking timeout (s)
     :param error_timeout: timeout if app persists in error state for set time (s)
-    :param wait_period: waiting time between checks (s)
-    :param loop: asyncio event loop
+    :param wait_period: unused, kept for compatibility (checks are driven by model changes)
+    :param loop: unused, kept for compatibility
     """
-    log_count = 0
-
-    if not loop:
-        loop = jasyncio.get_running_loop()
-
-    def _disconnected():
-        return not (model.is_connected() and model.connection().is_open)
-
-    async def _block(log_count):
-        blockable = ['maintenance', 'blocked', 'waiting', 'error']
-        success_counter = 0
-        errors = 0
-        # 10 consecutive success checks to pass
-        while success_counter < 5:
-            success_counter += 1
-            while (
-                not _disconnected() and
-                (
-                    any(a.status != 'active' for a in apps) or
-                    any(u.workload_status in blockable for a in apps for u in a.units)
+    blockable = ['maintenance', 'blocked', 'waiting', 'error']
+    status = model_status(model)
+    app_names = [a.name for a in apps]
+
+    def _ready():
+        app_statuses = status.app_statuses(app_names)
+        if error_timeout and app_statuses['error']:
+            failed = [
+                name for name, _, duration in status.stuck(app_names, statuses=['error'])
+                if duration >= max(error_timeout, 20)
+            ]
+            if failed:
+                log_workload(
+                    logger, model, apps,
+                    label='FAILED', error_status=True, status=False, workload=False, stuck=len(failed)
                 )
-            ):
-                success_counter = 0  # checks not successful - start again at 0
-                log_count += 0.5
-                if any(a.status == 'error' for a in apps):
-                    errors += wait_period
-                if error_timeout and errors >= max(error_timeout, 20):
-                    log_workload(
-                        logger, model, apps,
-                        label='FAILED', error_status=True, status=False, workload=False
-                    )
-                    raise ApperrorTimeout()
-                await asyncio.sleep(wait_period, loop=loop)
-                if log_count % log_time == 0:
-                    log_workload(logger, model, apps)
-            if success_counter != 0:
-                # Log if increasing consecutive check count
-                if all(a.status != 'error' for a in apps):
-                    errors = 0
-                await asyncio.sleep(2, loop=loop)
-                log_workload(logger, model, apps)
-
-    await asyncio.wait_for(_block(log_count), timeout, loop=loop)
-
-    if _disconnected():
+                raise ApperrorTimeout()
+        workload = status.workload_statuses(app_names)
+        return app_statuses['active'] == len(app_names) and not any(workload[ws] for ws in blockable)
+
+    connected = await asyncio.wait_for(wait_for(
+        model, _ready,
+        entity_types=['application', 'unit'],
+        settle=10,
+        log_time=log_time,
+        log_func=lambda: log_workload(logger, model, apps, stuck=3),
+    ), timeout)
+
+    if not connected:
         raise ConnectionClosed(1006, 'no reason')
     else:
         log_workload(logger, model, apps, label='DEPLOYED')
 
 
 def log_workload(
-    logger, model, apps, label='PROGRESS', status=True, workload=True, error_status=False, unit_status=False
+    logger, model, apps, label='PROGRESS', status=True, workload=True, error_status=False, unit_status=False,
+    stuck=0
 ):
+    """Log status of applications.
+
+    :param stuck: number of listed applications which are longest in a status other than active
+    """
+    tallies = model_status(model)
+    app_names = [a.name for a in apps]
     if status:
-        ass = dict(Counter([a.status if a.status else 'none' for a in apps]))
+        ass = dict(tallies.app_statuses(app_names))
         ass = 'Status: {}'.format(','.join([
             '{}={}'.format(k, v) for k, v in ass.items()
         ])) if ass else 'Status: None'
     else:
         ass = ''
     if workload:
-        wss = Counter([
-            unit.workload_status if unit.workload_status else 'none' for a in apps for unit in a.units
-        ])
+        wss = tallies.workload_statuses(app_names)
         wss = 'Workload: {}'.format(','.join([
             '{}={}'.format(k, v) for k, v in wss.items()
         ])) if wss else 'Workload: None'
@@ -185,7 +414,14 @@ def log_workload(
         wsm = 'Units: {}'.format('{}={}'.format(k, v) for k, v in wsm.items()) if wsm else 'Units: None'
     else:
         wsm = ''
-    msg = ' '.join([x for x in [ass, wss, asm, wsm] if x])
+    if stuck:
+        sas = tallies.stuck(app_names, limit=stuck)
+        sas = 'Stuck: {}'.format(','.join([
+            '{}({})={}s'.format(name, app_status, int(duration)) for name, app_status, duration in sas
+        ])) if sas else ''
+    else:
+        sas = ''
+    msg = ' '.join([x for x in [ass, wss, asm, wsm, sas] if x])
     logger.info('{} - Machines {} - Apps {} {}'.format(
         label,
         len(model.machines),
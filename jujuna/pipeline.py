@@ -0,0 +1,192 @@
+import os
+import asyncio
+import logging
+import yaml
+
+from jujuna.helper import share_connections, close_connections, log_traceback, load_yaml, parse_kv, SuiteError
+from jujuna.suite import load_suite
+
+from jujuna.deploy import deploy
+from jujuna.upgrade import upgrade
+from jujuna.tests import test
+from jujuna.clean import clean
+
+
+# create logger
+log = logging.getLogger('jujuna.pipeline')
+
+STAGES = {
+    'deploy': deploy,
+    'upgrade': upgrade,
+    'test': test,
+    'clean': clean,
+}
+
+# Stage arguments passed as paths (relative to the job file) and opened as files
+FILE_ARGS = ['bundle_file', 'test_suite', 'settings']
+
+# Stage arguments passed as mappings or comma separated key=value pairs
+KV_ARGS = ['upgrade_params', 'origin_keys']
+
+
+def load_job(stream):
+    """Load and validate pipeline job.
+
+    :param stream: job file (Yaml)
+    :return list: stages as tuples of action and arguments
+    """
+    base = os.path.dirname(getattr(stream, 'name', '') or '')
+    job = load_yaml(stream) or {}
+    if not isinstance(job, dict) or not isinstance(job.get('stages'), list):
+        raise SuiteError('Job has to contain a list of stages')
+    stages = []
+    for idx, stage in enumerate(job['stages']):
+        if isinstance(stage, str):
+            stage = {stage: {}}
+        if not isinstance(stage, dict) or len(stage) != 1:
+            raise SuiteError('Stage {} has to be a mapping with one action'.format(idx + 1))
+        action, args = list(stage.items())[0]
+        if action not in STAGES:
+            raise SuiteError('Stage {}: unknown action {} ({})'.format(idx + 1, action, ', '.join(STAGES)))
+        if args is not None and not isinstance(args, dict):
+            raise SuiteError('Stage {}: arguments of {} have to be a mapping'.format(idx + 1, action))
+        args = dict(args or {})
+        for key in FILE_ARGS:
+            if isinstance(args.get(key), str):
+                args[key] = os.path.join(base, args[key])
+        for key in KV_ARGS:
+            if isinstance(args.get(key), str):
+                args[key] = parse_kv(args[key])
+            elif args.get(key) is not None and not isinstance(args[key], dict):
+                raise SuiteError('Stage {}: {} has to be a mapping or key=value pairs'.format(idx + 1, key))
+        stages.append((action, args))
+    return stages
+
+
+async def run_stage(action, args, connection):
+    """Run stage action, files in arguments are opened for the stage.
+
+    :return int: exit code of the action
+    """
+    files = {key: open(args[key], 'r') for key in FILE_ARGS if isinstance(args.get(key), str)}
+    try:
+        ret = await STAGES[action](**dict(args, **files, **connection))
+        return ret if ret else 0
+    except Exception as e:
+        log.error('Stage {} failed'.format(action))
+        log_traceback(e)
+        return 1
+    finally:
+        for stream in files.values():
+            stream.close()
+
+
+async def run_overlapped(upgrade_args, test_args, connection):
+    """Upgrade applications and test every application once it is upgraded.
+
+    Applications of the suite which are not upgraded are tested after the upgrade.
+
+    :return int: exit code of the upgrade or the first failed test
+    """
+    try:
+        with open(test_args['test_suite'], 'r') as stream:
+            suite_apps = list(load_suite(stream).keys())
+    except (KeyError, IOError, OSError, yaml.YAMLError, SuiteError) as e:
+        log.error('Unable to load test suite of overlapping test: {}'.format(getattr(e, 'message', e)))
+        return 1
+
+    tested = []
+    tasks = []
+
+    def _on_upgraded(app_name):
+        if app_name in suite_apps and app_name not in tested:
+            log.info('Testing upgraded application: {}'.format(app_name))
+            tested.append(app_name)
+            tasks.append(asyncio.ensure_future(run_stage('test', dict(test_args, apps=[app_name]), connection)))
+
+    try:
+        ret = await run_stage('upgrade', dict(upgrade_args, on_upgraded=_on_upgraded), connection)
+        rets = list(await asyncio.gather(*tasks))
+    finally:
+        for task in tasks:
+            task.cancel()
+    remaining = [app_name for app_name in suite_apps if app_name not in tested]
+    if not ret and remaining:
+        rets.append(await run_stage('test', dict(test_args, apps=remaining), connection))
+    return ret or next((r for r in rets if r), 0)
+
+
+async def pipeline(
+    job_file,
+    ctrl_name=None,
+    model_name=None,
+    endpoint='',
+    username='',
+    password='',
+    cacert='',
+    **kwargs
+):
+    """Run stages of a job over one connection.
+
+    Job lists stages (deploy, upgrade, test, clean) with their arguments, named as in the command line
+    (files are passed as paths relative to the job file)::
+
+      stages:
+        - deploy:
+            bundle_file: bundle/bundle.yaml
+            wait: true
+        - upgrade:
+            origin: cloud:xenial-pike
+            parallel: 2
+        - test:
+            test_suite: tests/suite.yaml
+            overlap: true
+        - clean:
+            wait: true
+
+    Stages share the controller and model connection, model state is synchronized only once.
+    Test stage with overlap following the upgrade stage tests applications as soon as they are upgraded.
+    Pipeline stops at the first failed stage.
+
+    :param job_file: job file (Yaml)
+    :param ctrl_name: juju controller
+    :param model_name: juju model name or uuid
+    :param endpoint: string
+    :param username: string
+    :param password: string
+    :param cacert: string
+    """
+    try:
+        stages = load_job(job_file)
+    except (yaml.YAMLError, SuiteError) as e:
+        log.error('Invalid job: {}'.format(getattr(e, 'message', e)))
+        return 1
+
+    connection = {
+        'ctrl_name': ctrl_name, 'model_name': model_name,
+        'endpoint': endpoint, 'username': username, 'password': password, 'cacert': cacert,
+    }
+    shared = share_connections()
+    try:
+        idx = 0
+        while idx < len(stages):
+            action, args = stages[idx]
+            following = stages[idx + 1] if idx + 1 < len(stages) else (None, {})
+            if action == 'upgrade' and following[0] == 'test' and following[1].pop('overlap', False):
+                log.info('Stage {}: upgrade with overlapping test'.format(idx + 1))
+                ret = await run_overlapped(args, following[1], connection)
+                idx += 2
+            else:
+                args.pop('overlap', None)
+                log.info('Stage {}: {}'.format(idx + 1, action))
+                ret = await run_stage(action, args, connection)
+                idx += 1
+            if ret:
+                log.error('Pipeline stopped after stage {} ({})'.format(idx, ret))
+                return ret
+        log.info('Pipeline finished ({} stages)'.format(len(stages)))
+        return 0
+    finally:
+        # Connections shared by the daemon stay open
+        if shared:
+            await close_connections()
@@ -0,0 +1,140 @@
+import json
+import math
+import time
+import logging
+from contextlib import contextmanager
+from collections import defaultdict
+
+from jujuna.helper import parse_time
+
+
+# create logger
+log = logging.getLogger('jujuna.tests.profile')
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of values.
+
+    :param values: list of numbers
+    :param q: percentile (0-100)
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(int(math.ceil(q / 100.0 * len(ordered))) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def stats(values):
+    return {
+        'count': len(values),
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'max': max(values) if values else 0.0,
+        'total': sum(values),
+    }
+
+
+@contextmanager
+def measure(profiler, broker, unit, phase):
+    """Measure duration of the block if profiler is set.
+
+    :param profiler: Profiler or None
+    :param broker: broker name
+    :param unit: juju unit
+    :param phase: phase name
+    """
+    if profiler is None:
+        yield
+    else:
+        with profiler.measure(broker, unit.name, phase):
+            yield
+
+
+class Profiler():
+    """Timing of brokers and their phases during a test run.
+
+    Phases:
+    upload - exporter upload (scp, cache check or bundle)
+    run - juju exec round trip of the exporter
+    remote - exporter execution on the unit (reported by juju)
+    decode - JSON decode of exporter output
+    cleanup - removal of exporter
+    total - broker run for the unit
+    """
+
+    def __init__(self):
+        """Init profiler."""
+        self.samples = []
+
+    def record(self, broker, unit, phase, seconds):
+        """Record duration of the phase."""
+        self.samples.append((broker, unit, phase, seconds))
+
+    @contextmanager
+    def measure(self, broker, unit, phase):
+        """Measure duration of the block."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(broker, unit, phase, time.monotonic() - start)
+
+    def record_action(self, broker, unit, action_data):
+        """Record remote execution time from juju action data."""
+        started = parse_time(action_data.get('started', ''))
+        completed = parse_time(action_data.get('completed', ''))
+        if started is not None and completed is not None:
+            self.record(broker, unit, 'remote', max(completed - started, 0.0))
+
+    def summary(self):
+        """Summary statistics per broker, phase of the broker and unit."""
+        brokers = defaultdict(list)
+        phases = defaultdict(lambda: defaultdict(list))
+        units = defaultdict(float)
+        for broker, unit, phase, seconds in self.samples:
+            if phase == 'total':
+                brokers[broker].append(seconds)
+                units[unit] += seconds
+            else:
+                phases[broker][phase].append(seconds)
+        return {
+            'brokers': {broker: stats(values) for broker, values in sorted(brokers.items())},
+            'phases': {
+                broker: {phase: stats(values) for phase, values in sorted(broker_phases.items())}
+                for broker, broker_phases in sorted(phases.items())
+            },
+            'units': dict(sorted(units.items(), key=lambda item: item[1], reverse=True)),
+        }
+
+    def log_summary(self, slowest=5):
+        """Log summary table."""
+        summary = self.summary()
+        rows = {
+            'brokers': list(summary['brokers'].items()),
+            'phases': [
+                ('{}/{}'.format(broker, phase), values)
+                for broker, broker_phases in summary['phases'].items() for phase, values in broker_phases.items()
+            ],
+        }
+        row = '{:<20} {:>6} {:>8} {:>8} {:>8} {:>9}'
+        for section in ['brokers', 'phases']:
+            log.info(row.format(section.upper(), 'count', 'p50', 'p95', 'max', 'total'))
+            for name, values in rows[section]:
+                log.info(row.format(
+                    name, values['count'], '{:.2f}'.format(values['p50']), '{:.2f}'.format(values['p95']),
+                    '{:.2f}'.format(values['max']), '{:.2f}'.format(values['total'])
+                ))
+        for unit, seconds in list(summary['units'].items())[:slowest]:
+            log.info('Slowest unit: {} {:.2f}s'.format(unit, seconds))
+
+    def dump(self, path):
+        """Write summary and samples as JSON."""
+        with open(path, 'w') as stream:
+            json.dump({
+                'summary': self.summary(),
+                'samples': [
+                    {'broker': broker, 'unit': unit, 'phase': phase, 'seconds': seconds}
+                    for broker, unit, phase, seconds in self.samples
+                ],
+            }, stream, indent=2)
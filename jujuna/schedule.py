@@ -0,0 +1,158 @@
+import asyncio
+import logging
+
+
+log = logging.getLogger('jujuna.schedule')
+
+
+def build_dag(apps, order=None, relations=()):
+    """Build dependency graph of applications.
+
+    Ordering spec (upgrade_order in settings) consists of tiers and explicit edges::
+
+      upgrade_order:
+        tiers:
+          - keystone
+          - [ceph-mon, glance]
+        after:
+          openstack-dashboard: [keystone]
+
+    Applications of a tier are upgraded after applications of the previous tiers.
+    Related applications are upgraded in the order of apps, unless it contradicts the ordering spec.
+
+    :param apps: ordered list of application names
+    :param order: ordering spec
+    :param relations: list of related application name pairs
+    :return dict: application names and sets of applications to be upgraded before
+    """
+    order = order or {}
+    if not isinstance(order, dict):
+        raise ValueError('Upgrade order has to be a mapping (tiers, after)')
+    dag = {name: set() for name in apps}
+
+    previous = []
+    for tier in order.get('tiers', []) or []:
+        tier = [tier] if isinstance(tier, str) else tier
+        tier = [name for name in tier if name in dag]
+        if not tier:
+            continue
+        for name in tier:
+            dag[name].update(previous)
+        previous = tier
+
+    for name, before in (order.get('after', {}) or {}).items():
+        if name not in dag:
+            continue
+        before = [before] if isinstance(before, str) else before
+        dag[name].update(b for b in before if b in dag and b != name)
+
+    cycle = find_cycle(dag)
+    if cycle:
+        raise ValueError('Cyclic upgrade order: {}'.format(' -> '.join(cycle)))
+
+    position = {name: idx for idx, name in enumerate(apps)}
+    for pair in relations:
+        if len(set(pair)) != 2 or not all(name in dag for name in pair):
+            continue
+        first, second = sorted(pair, key=position.get)
+        # Relations only order the apps if not already ordered by the spec
+        if not depends_on(dag, first, second):
+            dag[second].add(first)
+
+    return dag
+
+
+def depends_on(dag, name, other):
+    """Whether the application depends (transitively) on the other application."""
+    stack = [name]
+    seen = set()
+    while stack:
+        current = stack.pop()
+        if current == other:
+            return True
+        if current in seen:
+            continue
+        seen.add(current)
+        stack.extend(dag.get(current, ()))
+    return False
+
+
+def find_cycle(dag):
+    """Find a cycle in the dependency graph.
+
+    :return list: application names forming the cycle, empty if the graph is acyclic
+    """
+    visited = set()
+
+    def _visit(name, path):
+        if name in path:
+            return path[path.index(name):] + [name]
+        if name in visited:
+            return []
+        visited.add(name)
+        for before in sorted(dag.get(name, ())):
+            cycle = _visit(before, path + [name])
+            if cycle:
+                return cycle
+        return []
+
+    for name in dag:
+        cycle = _visit(name, [])
+        if cycle:
+            return cycle
+    return []
+
+
+def model_relations(model):
+    """List related application name pairs of the model."""
+    pairs = []
+    for relation in model.relations:
+        names = sorted(set(app.name for app in relation.applications if app is not None))
+        if len(names) == 2:
+            pairs.append(tuple(names))
+    return pairs
+
+
+async def run_dag(dag, func, parallel=1):
+    """Run function for applications concurrently, respecting dependencies.
+
+    Ready applications are started in the order of the graph (insertion order).
+    After the first failure no other application is started, running ones are awaited
+    and the exception is raised.
+
+    :param dag: dependency graph (see build_dag)
+    :param func: coroutine function called with application name
+    :param parallel: maximum number of concurrently processed applications
+    """
+    pending = dict(dag)
+    done = set()
+    running = {}
+    error = None
+    try:
+        while pending or running:
+            if error is None:
+                for name in list(pending):
+                    if len(running) >= max(parallel, 1):
+                        break
+                    if pending[name] <= done:
+                        del pending[name]
+                        running[asyncio.ensure_future(func(name))] = name
+            if not running:
+                break
+            finished, _ = await asyncio.wait(list(running), return_when=asyncio.FIRST_COMPLETED)
+            for task in finished:
+                name = running.pop(task)
+                if task.exception() is not None:
+                    log.error('Failed processing: {}'.format(name))
+                    error = error or task.exception()
+                else:
+                    done.add(name)
+    finally:
+        for task in running:
+            task.cancel()
+
+    if error is not None:
+        raise error
+    if pending:
+        log.warning('Not processed: {}'.format(', '.join(pending)))
+    return done
@@ -2,6 +2,15 @@
 # Juju requires higher frame size for large models
 MAX_FRAME_SIZE = 2**26
 
+# Charmstore entities are cached to speed up repeated upgrade runs
+CHARMSTORE_CACHE = '~/.cache/jujuna/charmstore.json'
+
+# Finished upgrade steps are journaled to resume failed upgrades
+UPGRADE_JOURNAL = '~/.cache/jujuna/upgrade-{model}-{origin}.json'
+
+# Unix socket of the connection daemon (jujuna daemon), clients attach to it if JUJUNA_DAEMON is set
+DAEMON_SOCKET = '~/.cache/jujuna/daemon.sock'
+
 # Not all charms use the openstack-origin. The openstack specific
 # charms do, but some of the others use an alternate origin key
 # depending on who the author was.
@@ -51,3 +60,20 @@ SERVICES = [
 
     'rabbitmq-server',
 ]
+
+# Ordering spec used for parallel upgrades (upgrade --parallel N)
+# Applications of a tier are upgraded after all applications of the previous tiers,
+# 'after' lists explicit dependencies. Related applications keep the order of SERVICES.
+UPGRADE_ORDER = {
+    'tiers': [
+        ['keystone'],
+        ['ceph-mon'],
+        ['ceph-osd', 'ceph-radosgw'],
+    ],
+    'after': {
+        'nova-compute': ['nova-cloud-controller'],
+        'neutron-gateway': ['neutron-api'],
+        'neutron-openvswitch': ['neutron-api'],
+        'cinder-ceph': ['cinder'],
+    },
+}
@@ -0,0 +1,79 @@
+import logging
+from types import MappingProxyType
+
+from jujuna.helper import SuiteError, load_yaml
+
+from jujuna.brokers.api import Api as ApiBroker
+from jujuna.brokers.file import File as FileBroker
+from jujuna.brokers.mount import Mount as MountBroker
+from jujuna.brokers.network import Network as NetworkBroker
+from jujuna.brokers.package import Package as PackageBroker
+from jujuna.brokers.process import Process as ProcessBroker
+from jujuna.brokers.service import Service as ServiceBroker
+from jujuna.brokers.user import User as UserBroker
+
+
+# create logger
+log = logging.getLogger('jujuna.tests')
+
+BROKERS = {
+    'api': ApiBroker,
+    'file': FileBroker,
+    'mount': MountBroker,
+    'network': NetworkBroker,
+    'package': PackageBroker,
+    'process': ProcessBroker,
+    'service': ServiceBroker,
+    'user': UserBroker,
+}
+
+
+def load_suite(stream):
+    """Load and compile test suite.
+
+    :param stream: file object or string
+    :return: execution plan (see compile_suite)
+    """
+    return compile_suite(load_yaml(stream))
+
+
+def compile_suite(suite):
+    """Compile test suite into an execution plan.
+
+    Validates the suite, resolves brokers and lets brokers prepare their checks.
+    Plan is immutable and shared by all units of the application.
+
+    :param suite: dict of application names and their test cases
+    :return: mapping of application names to tuples of (broker name, broker class, checks)
+    """
+    if not isinstance(suite, dict):
+        raise SuiteError('Test suite has to be a mapping of applications')
+
+    plan = {}
+    for app_name, app_suite in suite.items():
+        if app_suite is None:
+            app_suite = {}
+        if not isinstance(app_suite, dict):
+            raise SuiteError('{}: test cases have to be a mapping of brokers'.format(app_name))
+        app_plan = []
+        for broker_name, test_case in app_suite.items():
+            if broker_name not in BROKERS:
+                log.warning("TEST: Skipped (Broker '{}' not registered)".format(broker_name))
+                continue
+            broker = BROKERS[broker_name]
+            try:
+                checks = broker.compile(test_case)
+            except SuiteError as e:
+                raise SuiteError('{}.{}: {}'.format(app_name, broker_name, e.message))
+            app_plan.append((broker_name, broker, checks))
+        plan[str(app_name)] = tuple(app_plan)
+    return MappingProxyType(plan)
+
+
+def count_checks(checks):
+    """Count checks of the compiled test case."""
+    if hasattr(checks, 'items'):
+        return sum(count_checks(value) for value in checks.values())
+    if isinstance(checks, tuple):
+        return sum(count_checks(value) for value in checks)
+    return 1
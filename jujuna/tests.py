@@ -1,20 +1,15 @@
 import time  # noqa
 import yaml
 import json
+import asyncio
 import logging
 import async_timeout
 from collections import defaultdict
 from juju.errors import JujuError
-from jujuna.helper import connect_juju, log_traceback
-
-from jujuna.brokers.api import Api as ApiBroker
-from jujuna.brokers.file import File as FileBroker
-from jujuna.brokers.mount import Mount as MountBroker
-from jujuna.brokers.network import Network as NetworkBroker
-from jujuna.brokers.package import Package as PackageBroker
-from jujuna.brokers.process import Process as ProcessBroker
-from jujuna.brokers.service import Service as ServiceBroker
-from jujuna.brokers.user import User as UserBroker
+from jujuna.helper import connect_juju, log_traceback, get_unit_machine, SuiteError
+from jujuna.exporters import ExporterBundles, ExporterResults
+from jujuna.profiling import Profiler, measure
+from jujuna.suite import load_suite, count_checks
 
 
 # create logger
@@ -29,11 +24,36 @@ async def test(
     username='',
     password='',
     cacert='',
+    parallel=1,
+    parallel_app=0,
+    parallel_machine=0,
+    exporter_bundle=None,
+    exporter_cache=False,
+    exporter_transport='scp',
+    machine_cache=True,
+    profile=False,
+    profile_output=None,
+    apps=None,
     **kwargs
 ):
     """Run a test suite against applications deployed in the current or selected model.
 
     Applications are tested with declarative parameters specified in the test suite using the available brokers.
+    Test suite is validated and compiled into an execution plan before connecting to the model.
+
+    Units are tested concurrently up to the limit of parallel units, optionally bounded per application
+    and per machine. Results are reported in the order of applications and units in the model.
+
+    Exporters are uploaded separately for every broker, unless exporter bundle is selected. Bundle of all
+    exporters is then uploaded once per unit or once per machine and shared by brokers.
+    With exporter cache, exporters are kept on units by content hash and uploaded only when missing.
+    Inline exporter transport passes the exporter source within the command and does not require ssh.
+
+    Machine level data (processes, mounts, network, packages, services and users) are collected once
+    per machine and shared by all units on the machine, unless machine cache is disabled.
+
+    Profile logs time spent in brokers and their phases (upload, run, remote, decode, cleanup)
+    and optionally writes it as JSON to the profile output file.
 
     Connection requires juju client configs to be present locally or specification of credentialls:
     endpoint (e.g. 127.0.0.1:17070), username, password, and model uuid as model_name.
@@ -45,21 +65,31 @@ async def test(
     :param username: string
     :param password: string
     :param cacert: string
+    :param parallel: maximum number of units tested at once
+    :param parallel_app: maximum number of units of one application tested at once (0 = unlimited)
+    :param parallel_machine: maximum number of units on one machine tested at once (0 = unlimited)
+    :param exporter_bundle: upload exporter bundle per unit or per machine (None, unit, machine)
+    :param exporter_cache: boolean
+    :param exporter_transport: scp or inline
+    :param machine_cache: boolean
+    :param profile: boolean
+    :param profile_output: path to JSON profile file
+    :param apps: list of tested applications (def: all applications in the suite)
     """
     log.info('Load tests')
+    suite = {}
     if test_suite:
         with open(test_suite.name, 'r') as stream:
             try:
-                if hasattr(yaml, 'full_load'):
-                    suite = yaml.full_load(stream)
-                else:
-                    suite = yaml.load(stream)
-                suite_apps = suite.keys()
+                suite = load_suite(stream)
             except yaml.YAMLError as exc:
                 log.error(exc)
-                suite_apps = []
+                return 1
+            except SuiteError as exc:
+                log.error('Invalid test suite: {}'.format(exc.message))
+                return 1
 
-    log.info('Applications: {}'.format(', '.join(suite_apps)))
+    log.info('Applications: {}'.format(', '.join(suite.keys())))
 
     controller, model = await connect_juju(
         ctrl_name,
@@ -73,30 +103,54 @@ async def test(
     model_passed, model_failed = 0, 0
     failed_units = set()
 
+    if exporter_transport == 'inline' and (exporter_bundle or exporter_cache):
+        log.warning('Exporter bundle and cache are not used with inline transport')
+        exporter_bundle, exporter_cache = None, False
+
+    scheduler = UnitScheduler(parallel, parallel_app, parallel_machine)
+    bundles = ExporterBundles(exporter_bundle, persistent=exporter_cache) if exporter_bundle else None
+    exporter_options = {'bundles': bundles} if bundles else {'persistent': exporter_cache}
+    exporter_options['transport'] = exporter_transport
+    profiler = Profiler() if (profile or profile_output) else None
+    if profiler:
+        exporter_options['profiler'] = profiler
+    results = ExporterResults() if machine_cache else None
+    tasks = []
+
     try:
-        for app_name, app in model.applications.items():
-            if suite and app_name in suite:
-                app_passed, app_failed = 0, 0
-                try:
-                    test_cases = len([
-                        key for x in suite[app_name].values() for y in x.values() if isinstance(x, dict) for key in y
-                    ])
-                except Exception:
-                    test_cases = 0
-                log.info('{} - {} - {} units - {} tests - {} {}'.format(
-                    "----", app_name, len(app.units), test_cases, app.status, app.alive
-                ))
-                for idx, unit in enumerate(app.units):
-                    async with async_timeout.timeout(60):
-                        passed, failed = await execute_brokers(suite[app_name], unit, idx)
-                        app_passed += passed
-                        app_failed += failed
-                        if app.status in ['error', 'maintenance', 'blocked'] or failed:
-                            failed_units.add(unit.name)
-                model_passed += app_passed
-                model_failed += app_failed
-                log.info('{} - {}: Passed tests: {}'.format("====", app_name, app_passed))
-                log.info('{} - {}: Failed tests: {}'.format("====", app_name, app_failed))
+        # Units are scheduled at once, results are collected in the order of the model
+        selected = [
+            (app_name, app, list(app.units)) for app_name, app in model.applications.items()
+            if suite and app_name in suite and (apps is None or app_name in apps)
+        ]
+        for app_name, app, units in selected:
+            for idx, unit in enumerate(units):
+                task = asyncio.ensure_future(
+                    scheduler.run(
+                        app_name, unit, execute_brokers, suite[app_name], unit, idx, exporter_options, results
+                    )
+                )
+                task.add_done_callback(_retrieve_exception)
+                tasks.append(task)
+
+        progress = iter(tasks)
+        for app_name, app, units in selected:
+            app_passed, app_failed = 0, 0
+            test_cases = sum(count_checks(checks) for _, _, checks in suite[app_name])
+            log.info('{} - {} - {} units - {} tests - {} {}'.format(
+                "----", app_name, len(units), test_cases, app.status, app.alive
+            ))
+            for unit in units:
+                unit_results = await next(progress)
+                passed, failed = report_results(unit, unit_results)
+                app_passed += passed
+                app_failed += failed
+                if app.status in ['error', 'maintenance', 'blocked'] or failed:
+                    failed_units.add(unit.name)
+            model_passed += app_passed
+            model_failed += app_failed
+            log.info('{} - {}: Passed tests: {}'.format("====", app_name, app_passed))
+            log.info('{} - {}: Failed tests: {}'.format("====", app_name, app_failed))
 
         alive = defaultdict(int)
         status = defaultdict(int)
@@ -124,6 +178,15 @@ async def test(
         log.error('JujuError during tests')
         log_traceback(e)
     finally:
+        # Failed runs are profiled as well
+        if profiler:
+            profiler.log_summary()
+            if profile_output:
+                profiler.dump(profile_output)
+        for task in tasks:
+            task.cancel()
+        if bundles:
+            await bundles.close()
         # Disconnect from the api server and cleanup.
         await model.disconnect()
         await controller.disconnect()
@@ -151,34 +214,100 @@ def load_output(results):
     return var
 
 
-async def execute_brokers(app_test_suite, unit, idx):
-    """Iterate brokers and acquire results.
+class UnitScheduler():
+    """Bounded concurrency of unit tests.
+
+    Limits the number of units tested at once in total, per application and per machine.
+    """
+
+    def __init__(self, parallel=1, parallel_app=0, parallel_machine=0, timeout=60):
+        """Init scheduler.
+
+        :param parallel: maximum number of units tested at once
+        :param parallel_app: maximum number of units per application (0 = unlimited)
+        :param parallel_machine: maximum number of units per machine (0 = unlimited)
+        :param timeout: timeout of a single unit (s)
+        """
+        self.parallel = max(parallel, 1)
+        self.parallel_app = parallel_app
+        self.parallel_machine = parallel_machine
+        self.timeout = timeout
+        self.limits = {}
+
+    def _limit(self, key, size):
+        if not size:
+            return None
+        if key not in self.limits:
+            self.limits[key] = asyncio.Semaphore(size)
+        return self.limits[key]
+
+    async def run(self, app_name, unit, func, *args):
+        """Run func(*args) for the unit when limits allow it.
 
+        Limits are always acquired in the same order (application, machine, total) to avoid deadlocks.
+        """
+        limits = [
+            self._limit(('app', app_name), self.parallel_app),
+            self._limit(('machine', get_unit_machine(unit)), self.parallel_machine),
+            self._limit(('all', None), self.parallel),
+        ]
+        limits = [limit for limit in limits if limit is not None]
+        for idx, limit in enumerate(limits):
+            try:
+                await limit.acquire()
+            except BaseException:
+                for acquired in limits[:idx]:
+                    acquired.release()
+                raise
+        try:
+            async with async_timeout.timeout(self.timeout):
+                return await func(*args)
+        finally:
+            for limit in limits:
+                limit.release()
+
+
+def _retrieve_exception(task):
+    # Exceptions are raised when results are collected, avoid warnings for tasks cancelled before that
+    if not task.cancelled():
+        task.exception()
+
+
+def report_results(unit, results):
+    """Log results of a unit and count passed and failed tests.
+
+    :param unit: juju unit
+    :param results: list of (test_case, row) tuples returned by execute_brokers
     """
-    broker_map = {
-        'api': ApiBroker,
-        'file': FileBroker,
-        'mount': MountBroker,
-        'network': NetworkBroker,
-        'package': PackageBroker,
-        'process': ProcessBroker,
-        'service': ServiceBroker,
-        'user': UserBroker,
-    }
     passed = 0
     failed = 0
-
-    for test_case in app_test_suite.keys():
-        if test_case in broker_map.keys():
-            # log.info('{} - {}: {}'.format("unit", unit.entity_id, test_case))
-            rows = await broker_map[test_case]().run(app_test_suite[test_case], unit, idx)
-            for row in rows:
-                if row[2]:
-                    log.info('{} - {}: {} {}'.format("PASS", unit.entity_id, test_case, row[1]))
-                    passed += 1
-                else:
-                    log.info('{} - {}: {} {}'.format("FAIL", unit.entity_id, test_case, row[1]))
-                    failed += 1
+    for test_case, row in results:
+        if row[2]:
+            log.info('{} - {}: {} {}'.format("PASS", unit.entity_id, test_case, row[1]))
+            passed += 1
         else:
-            log.warning("TEST: Skipped (Broker '{}' not registered)".format(test_case))
+            log.info('{} - {}: {} {}'.format("FAIL", unit.entity_id, test_case, row[1]))
+            failed += 1
     return passed, failed
+
+
+async def execute_brokers(app_test_suite, unit, idx, exporter_options=None, results=None):
+    """Iterate brokers and acquire results.
+
+    Returns a list of (test_case, row) tuples in the order of the test suite.
+
+    :param app_test_suite: compiled test suite of the application (tuple of broker name, class and checks)
+    :param unit: juju unit
+    :param idx: index of the unit
+    :param exporter_options: dict of keyword arguments passed to exporters
+    :param results: ExporterResults shared by units on the same machine
+    """
+    unit_results = []
+
+    for test_case, broker_class, checks in app_test_suite:
+        # log.info('{} - {}: {}'.format("unit", unit.entity_id, test_case))
+        broker = broker_class(exporter_options, results)
+        with measure(broker.exporter_options.get('profiler'), test_case, unit, 'total'):
+            rows = await broker.run(checks, unit, idx)
+        unit_results.extend((test_case, row) for row in rows)
+    return unit_results
@@ -6,11 +6,13 @@ import async_timeout
 
 from collections import Counter
 
-from jujuna.helper import cs_name_parse, connect_juju, log_traceback
-from jujuna.settings import ORIGIN_KEYS, SERVICES
+from jujuna.helper import cs_name_parse, connect_juju, log_traceback, load_yaml, CharmstoreCache, UpgradeJournal
+from jujuna.settings import ORIGIN_KEYS, SERVICES, UPGRADE_ORDER
+from jujuna.schedule import build_dag, model_relations, run_dag
+from jujuna.wait import wait_for, wait_signal, model_status
 
+from juju.client import client
 from juju.errors import JujuError
-from juju import jasyncio
 
 
 # create logger
@@ -36,6 +38,14 @@ async def upgrade(
     username='',
     password='',
     cacert='',
+    lookup_concurrency=8,
+    charmstore_ttl=600,
+    parallel=1,
+    max_unavailable=1,
+    max_failures=None,
+    wait_scope='related',
+    resume=False,
+    on_upgraded=None,
     **kwargs
 ):
     """Upgrade applications deployed in the model.
@@ -62,6 +72,16 @@ async def upgrade(
     :param username: string
     :param password: string
     :param cacert: string
+    :param lookup_concurrency: maximum number of concurrent charmstore lookups
+    :param charmstore_ttl: time to live of cached charmstore entities (s), 0 disables the cache
+    :param parallel: maximum number of concurrently upgraded applications, ordered by upgrade_order
+        in settings (tiers, after) and relations in the model
+    :param max_unavailable: number of units upgraded at once during rolling upgrade
+    :param max_failures: number of failed units tolerated before rolling upgrade stops (None - unlimited)
+    :param wait_scope: applications to wait for after each upgrade step, upgraded app (incl. subordinates),
+        related apps or whole model (app, related, model)
+    :param resume: skip steps finished by previous run with the same model and origin (see UpgradeJournal)
+    :param on_upgraded: callable called with application name once the application is upgraded
     """
 
     controller, model = await connect_juju(
@@ -83,16 +103,15 @@ async def upgrade(
         try:
             if settings:
                 with open(settings.name, 'r') as stream:
-                    if hasattr(yaml, 'full_load'):
-                        settings_data = yaml.full_load(stream)
-                    else:
-                        settings_data = yaml.load(stream)
+                    settings_data = load_yaml(stream)
         except yaml.YAMLError as e:
             log.warn('Failed to load settings file: {}'.format(str(e)))
 
         origin_keys = settings_data.get('origin_keys', origin_keys if origin_keys else ORIGIN_KEYS)
         services = settings_data.get('services', SERVICES)
         add_services = settings_data.get('add_services', [])
+        upgrade_order = settings_data.get('upgrade_order', UPGRADE_ORDER)
+        journal = None if dry_run else UpgradeJournal(model.info.uuid, origin, resume=resume)
 
         # If apps are not specified in the order use configuration from settings
         if apps:
@@ -109,7 +128,10 @@ async def upgrade(
         # Upgrade charm revisions
         if not upgrade_only:
             upgraded, latest_charms = await upgrade_charms(
-                model, all_services, dry_run, ignore_errors
+                model, all_services, dry_run, ignore_errors,
+                lookup_concurrency=lookup_concurrency,
+                charmstore_cache=CharmstoreCache(ttl=charmstore_ttl),
+                journal=journal
             )
 
         # Ocata upgrade requires additional relation to succeed
@@ -122,7 +144,10 @@ async def upgrade(
         # Upgrade applications
         if not charms_only:
             await upgrade_services(
-                model, applications, origin, origin_keys, upgrade_action, upgrade_params, pause, dry_run
+                model, applications, origin, origin_keys, upgrade_action, upgrade_params, pause, dry_run,
+                parallel=parallel, upgrade_order=upgrade_order,
+                max_unavailable=max_unavailable, max_failures=max_failures, wait_scope=wait_scope,
+                journal=journal, on_upgraded=on_upgraded
             )
 
         # Log status values
@@ -140,8 +165,13 @@ async def ocata_relation_patch(model, dry_run, cinder_ceph):
     if not dry_run:
         try:
             await model.add_relation('nova-compute:ceph-access', cinder_ceph_rel)
-            # TODO add completion check
-            await asyncio.sleep(120)
+            if not await wait_signal(
+                model,
+                lambda: any(rel.matches('nova-compute:ceph-access', cinder_ceph_rel) for rel in model.relations),
+                entity_types=['relation'],
+                timeout=120,
+            ):
+                log.warn('Relation {} is not present in the model yet'.format(cinder_ceph_rel))
             await wait_until(
                 model,
                 model.applications.values(),
@@ -168,21 +198,46 @@ def get_service_version(application):
     return serv_version
 
 
-async def upgrade_services(model, upgraded, origin, origin_keys, upgrade_action, upgrade_params, pause, dry_run):
+async def upgrade_services(
+    model, upgraded, origin, origin_keys, upgrade_action, upgrade_params, pause, dry_run,
+    parallel=1, upgrade_order=None, max_unavailable=1, max_failures=None, wait_scope='related', journal=None,
+    on_upgraded=None
+):
+    """Upgrade applications.
+
+    Applications are upgraded in the listed order by default. With parallel > 1 independent applications
+    are upgraded concurrently, respecting the ordering spec and relations in the model (see build_dag).
+
+    :param parallel: maximum number of concurrently upgraded applications
+    :param upgrade_order: ordering spec (tiers, after)
+    :param max_unavailable: number of units upgraded at once during rolling upgrade
+    :param max_failures: number of failed units tolerated before rolling upgrade stops (None - unlimited)
+    :param wait_scope: applications to wait for after each upgrade step (see get_wait_scope)
+    :param journal: UpgradeJournal
+    :param on_upgraded: callable called with application name once the application is upgraded
+    """
     sl_before = get_service_list(model, upgraded)
     log.info('Application upgrade order: {}'.format(
         ', '.join(['{} ({})'.format(name, version) for name, version in sl_before])
     ))
 
-    s_upgrade = 0
+    s_upgrade = []
     # upgrade_action is none by default, otherwise enforcing perform_upgrade
     use_action = upgrade_action if upgrade_action else 'openstack-upgrade'
-    for app_name in upgraded:
-        if app_name not in model.applications:
-            continue
-        rollable_app = await is_rollable(model.applications[app_name], use_action)
+    # Leaders are resolved once for the upgrade (see order_units)
+    leaders = {}
+    catalog = ActionCatalog()
+
+    async def _upgrade(app_name):
+        failures = 0
+        if journal and journal.done('app', app_name):
+            log.info('Skipping finished upgrade: {}'.format(app_name))
+            if on_upgraded:
+                on_upgraded(app_name)
+            return
+        rollable_app = await is_rollable(model.applications[app_name], use_action, catalog=catalog)
         if upgrade_action or rollable_app:
-            await perform_upgrade(
+            failures = await perform_upgrade(
                 model,
                 model.applications[app_name],
                 origin_keys,
@@ -191,32 +246,99 @@ async def upgrade_services(model, upgraded, origin, origin_keys, upgrade_action,
                 rollable=rollable_app,
                 origin=origin,
                 pause=pause,
-                dry_run=dry_run
+                dry_run=dry_run,
+                max_unavailable=max_unavailable,
+                max_failures=max_failures,
+                wait_scope=wait_scope,
+                leaders=leaders,
+                journal=journal,
+                catalog=catalog
             )
-            s_upgrade += 1
         else:
             await perform_bigbang_upgrade(
                 model.applications[app_name],
                 origin_keys,
                 origin=origin,
-                dry_run=dry_run
+                dry_run=dry_run,
+                journal=journal
             )
-            s_upgrade += 1
+        s_upgrade.append(app_name)
 
         await wait_until(
             model,
-            model.applications.values(),
+            get_wait_scope(model, model.applications[app_name], wait_scope),
             timeout=1800,
         )
+        # Application with failed units is not finished, resumed upgrade retries the units
+        if failures:
+            log.warning('Upgrade of {} finished with {} failed units'.format(app_name, failures))
+        elif journal:
+            journal.record('app', app_name)
+        if on_upgraded:
+            on_upgraded(app_name)
+
+    present = [app_name for app_name in upgraded if app_name in model.applications]
+    await catalog.prefetch([model.applications[app_name] for app_name in present])
+    if parallel > 1:
+        dag = build_dag(present, upgrade_order, model_relations(model))
+        log.info('Application upgrade dependencies: {}'.format(
+            ', '.join(['{} ({})'.format(name, ', '.join(sorted(before))) for name, before in dag.items() if before])
+        ))
+        await run_dag(dag, _upgrade, parallel)
+    else:
+        for app_name in present:
+            await _upgrade(app_name)
 
     sl_after = get_service_list(model, upgraded)
     log.info('Application upgrade order: {}'.format(
         ', '.join(['{} ({}=>{})'.format(before[0], before[1], after[1]) for before, after in zip(sl_before, sl_after)])
     ))
-    log.info('Upgrade finished ({} upgraded services)'.format(s_upgrade))
+    log.info('Upgrade finished ({} upgraded services)'.format(len(s_upgrade)))
+
 
+async def resolve_revisions(model, apps, concurrency=8, cache=None):
+    """Resolve latest charmstore revisions of applications.
 
-async def upgrade_charms(model, apps, dry_run, ignore_errors):
+    Charmstore is queried concurrently (once per charm), before any upgrade starts.
+    Applications with target revision, local charms and missing applications are skipped.
+
+    :param model: juju model
+    :param apps: list of parsed application names (see cs_name_parse)
+    :param concurrency: maximum number of concurrent lookups
+    :param cache: CharmstoreCache
+    :return dict: charm names and latest revisions (exception if lookup failed)
+    """
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+    charms = []
+    for app_name in apps:
+        if app_name['charm'] not in model.applications or app_name.get('revision') is not None:
+            continue
+        parse = cs_name_parse(model.applications[app_name['charm']].data['charm-url'])
+        if parse.get('charmstore', False) and parse['charm'] not in charms:
+            charms.append(parse['charm'])
+
+    async def _lookup(charm):
+        entity_id = cache.get(charm) if cache else None
+        if entity_id is None:
+            async with semaphore:
+                charmstore_entity = await model.charmstore.entity(
+                    charm, include_stats=False, includes=['revision-info']
+                )
+            # latest = charmstore_entity['Meta']['revision-info']['Revisions'][0]
+            entity_id = charmstore_entity['Id']
+            if cache:
+                cache.set(charm, entity_id)
+        return cs_name_parse(entity_id)['revision']
+
+    revisions = await asyncio.gather(*[_lookup(charm) for charm in charms], return_exceptions=True)
+    if cache:
+        cache.save()
+    return dict(zip(charms, revisions))
+
+
+async def upgrade_charms(
+    model, apps, dry_run, ignore_errors, lookup_concurrency=8, charmstore_cache=None, journal=None
+):
     """Upgrade charm revisions in the model.
 
     Listed apps will be checked for new revisions in charmstore
@@ -226,12 +348,23 @@ async def upgrade_charms(model, apps, dry_run, ignore_errors):
     :param apps: ordered list of application names
     :param dry_run: boolean
     :param ignore_errors: boolean
+    :param lookup_concurrency: maximum number of concurrent charmstore lookups
+    :param charmstore_cache: CharmstoreCache
+    :param journal: UpgradeJournal, charms upgraded by previous run are skipped
     """
     log.info('Upgrading charms')
     upgraded = []
     latest_charms = []
     failed_upgrade = False
 
+    if journal:
+        finished = [app_name['charm'] for app_name in apps if journal.done('charm', app_name['charm'])]
+        if finished:
+            log.info('Skipping finished charm upgrades: {}'.format(', '.join(finished)))
+        apps = [app_name for app_name in apps if app_name['charm'] not in finished]
+
+    revisions = await resolve_revisions(model, apps, lookup_concurrency, charmstore_cache)
+
     for app_name in apps:
         attemp_update = False
         target_revision = None
@@ -246,21 +379,17 @@ async def upgrade_charms(model, apps, dry_run, ignore_errors):
         current_revision = parse['revision'] if parse['revision'] else 0
         app = model.applications[app_name['charm']]
 
-        # Charmstore get latest revision
+        # Charmstore latest revision
         if parse.get('charmstore', False):
-            try:
-                if app_name.get('revision') is None:
-                    charmstore_entity = await model.charmstore.entity(
-                        parse['charm'], include_stats=False, includes=['revision-info']
-                    )
-                    # latest = charmstore_entity['Meta']['revision-info']['Revisions'][0]
-                    charm_id = cs_name_parse(charmstore_entity['Id'])
-                    target_revision = charm_id['revision']
-                else:
-                    target_revision = app_name['revision']
-            except Exception:
-                log.warning('Failed loading information from charmstore: {}'.format(charm_url))
-                attemp_update = True
+            if app_name.get('revision') is None:
+                target_revision = revisions.get(parse['charm'])
+                if isinstance(target_revision, Exception):
+                    log.warning('Failed loading information from charmstore: {}'.format(charm_url))
+                    log.debug(target_revision)
+                    target_revision = None
+                    attemp_update = True
+            else:
+                target_revision = app_name['revision']
         else:
             log.info('Not upgrading local charm: {}'.format(charm_url))
 
@@ -275,8 +404,16 @@ async def upgrade_charms(model, apps, dry_run, ignore_errors):
                     await app.upgrade_charm(
                         revision=target_revision
                     )
-                    await asyncio.sleep(30)
+                    if not await wait_signal(
+                        model,
+                        lambda: app.safe_data.get('charm-url') != charm_url,
+                        entity_types=['application'],
+                        timeout=60,
+                    ):
+                        log.warning('Charm url of {} has not changed yet'.format(app_name['charm']))
                 upgraded.append(app_name['charm'])
+                if journal:
+                    journal.record('charm', app_name['charm'])
             except JujuError:
                 log.warning('Not upgrading: {}'.format(app_name['charm']))
             except Exception:
@@ -286,11 +423,23 @@ async def upgrade_charms(model, apps, dry_run, ignore_errors):
                     break
         else:
             latest_charms.append(app_name['charm'])
+            if journal:
+                journal.record('charm', app_name['charm'])
 
     log.info('Upgraded: {} charms'.format(len(upgraded)))
 
     if not dry_run and upgraded:
-        await asyncio.sleep(20)
+        upgraded_apps = [model.applications[name] for name in upgraded if name in model.applications]
+
+        def _units_upgraded():
+            return all(
+                unit.safe_data.get('charm-url') == app.safe_data.get('charm-url')
+                for app in upgraded_apps for unit in app.units
+            )
+
+        # Units report the new charm url once the upgrade-charm hook has run
+        if not await wait_signal(model, _units_upgraded, entity_types=['application', 'unit'], timeout=300):
+            log.warning('Not all units have finished upgrading charms')
         await wait_until(
             model,
             list(model.applications.values()),
@@ -298,7 +447,6 @@ async def upgrade_charms(model, apps, dry_run, ignore_errors):
         )
 
     log.info('Collecting final workload status')
-    await asyncio.sleep(20)
 
     wss = Counter()
     wsm = Counter()
@@ -316,46 +464,74 @@ async def upgrade_charms(model, apps, dry_run, ignore_errors):
     return upgraded, latest_charms
 
 
-async def wait_until(model, apps, log_time=10, timeout=None, wait_period=0.5, loop=None):
+async def wait_until(model, apps, log_time=10, timeout=None, wait_period=0.5, loop=None, settle=0):
     """Blocking with logs.
 
     Return only after all conditions are true.
-    Waiting for maintenance units to become active.
+    Waiting for maintenance units to become active, evaluated on changes of units in the model.
+    Callers wait for units to react to the change first (see wait_units_changed).
 
     :param model: juju model
     :param apps: list of juju applications
     :param log_time: logging frequency (s)
     :param timeout: blocking timeout (s)
-    :param wait_period: waiting time between checks (s)
-    :param loop: asyncio event loop
+    :param settle: units have to stay ready for this time (s), not required by default
+    :param wait_period: unused, kept for compatibility (checks are driven by model changes)
+    :param loop: unused, kept for compatibility
     """
-    log_count = 0
+    blockable = ['maintenance', 'blocked', 'waiting', 'error']
+    status = model_status(model)
+    app_names = [a.name for a in apps]
+
+    def _ready():
+        workload = status.workload_statuses(app_names)
+        return not any(workload[ws] for ws in blockable)
+
+    def _log():
+        wss = status.workload_statuses(app_names)
+        stuck = ['{}({})={}s'.format(name, app_status, int(duration))
+                 for name, app_status, duration in status.stuck(app_names, limit=3)]
+        log.info('[WAITING] Charm workload status: {}{}'.format(
+            dict(wss), ' Stuck: {}'.format(','.join(stuck)) if stuck else ''
+        ))
 
-    if not loop:
-        loop = jasyncio.get_running_loop()
+    connected = await asyncio.wait_for(wait_for(
+        model, _ready,
+        entity_types=['application', 'unit'],
+        settle=settle,
+        log_time=log_time,
+        log_func=_log,
+    ), timeout)
 
-    def _disconnected():
-        return not (model.is_connected() and model.connection().is_open)
+    if not connected:
+        raise websockets.ConnectionClosed(1006, 'no reason')
 
-    async def _block(log_count):
-        blockable = ['maintenance', 'blocked', 'waiting', 'error']
-        while not _disconnected() and any(u.workload_status in blockable for a in apps for u in a.units):
-            await asyncio.sleep(wait_period, loop=loop)
-            log_count += 0.5
-            if log_count % log_time == 0:
-                wss = Counter([
-                    unit.workload_status for a in apps for unit in a.units
-                ])
-                log.info('[WAITING] Charm workload status: {}'.format(dict(wss)))
 
-    await asyncio.sleep(2)
-    await asyncio.wait_for(_block(log_count), timeout, loop=loop)
+def agent_status_times(units):
+    """Snapshot of agent status timestamps of the units (see wait_units_changed)."""
+    return {unit.name: unit.agent_status_since for unit in units}
 
-    if _disconnected():
-        raise websockets.ConnectionClosed(1006, 'no reason')
 
+async def wait_units_changed(model, units, before, timeout=60):
+    """Wait for units to react to a change (agent status transition) with a timeout fallback.
 
-async def is_rollable(application, upgrade_action):
+    :param model: juju model
+    :param units: list of juju units
+    :param before: agent status timestamps taken before the change (see agent_status_times)
+    :param timeout: fallback timeout (s)
+    :return boolean: True if all units reacted
+    """
+    if not units:
+        return True
+    return await wait_signal(
+        model,
+        lambda: all(unit.agent_status_since != before.get(unit.name) for unit in units),
+        entity_types=['unit'],
+        timeout=timeout,
+    )
+
+
+async def is_rollable(application, upgrade_action, catalog=None):
     """Define whether the application is rollable.
 
     Application is considered rollable if it provides upgrade action
@@ -363,8 +539,10 @@ async def is_rollable(application, upgrade_action):
     is not ceph and successfuly applies action-managed-upgrade config.
 
     :param application: juju application
+    :param upgrade_action: string
+    :param catalog: ActionCatalog shared during the upgrade
     """
-    actions = await enumerate_actions(application)
+    actions = await enumerate_actions(application, catalog=catalog)
 
     if (not upgrade_action) or (upgrade_action not in actions):
         log.warn('Upgrade action "{}" not in actions.'.format(
@@ -412,43 +590,178 @@ def get_hacluster_subordinate_pairs(application):
     return {}
 
 
-async def enumerate_actions(application):
+def get_wait_scope(model, application, scope='related'):
+    """Get applications to wait for after upgrade of the application.
+
+    :param model: juju model
+    :param application: juju application
+    :param scope: app (incl. subordinates), related (directly related apps) or model
+    :return list: juju applications
+    """
+    if scope == 'model':
+        return list(model.applications.values())
+
+    names = {application.name}
+    for relation in application.relations:
+        if scope == 'related' or relation.is_subordinate:
+            names.update(app.name for app in relation.applications if app is not None)
+    return [app for app in model.applications.values() if app.name in names]
+
+
+# Action statuses after which the action does not run anymore
+ACTION_FAILED = ('failed', 'cancelled', 'aborting', 'aborted', 'error')
+ACTION_FINISHED = ('completed',) + ACTION_FAILED
+
+
+async def wait_actions(model, actions, poll=0.5, max_poll=5):
+    """Wait for completion of actions.
+
+    Status of all pending actions is retrieved with a single query, polling interval grows
+    up to max_poll while the actions are running.
+
+    :param model: juju model
+    :param actions: list of juju actions
+    :param poll: initial polling interval (s)
+    :param max_poll: maximum polling interval (s)
+    :return list: final statuses of the actions
+    """
+    facade = client.ActionFacade.from_connection(model.connection())
+    statuses = {'action-{}'.format(action.entity_id): None for action in actions}
+    while True:
+        pending = [tag for tag, status in statuses.items() if status is None]
+        if not pending:
+            return list(statuses.values())
+        response = await facade.Actions(entities=[{'tag': tag} for tag in pending])
+        for tag, result in zip(pending, response.results):
+            if result.error:
+                statuses[tag] = 'error'
+            elif result.status in ACTION_FINISHED:
+                statuses[tag] = result.status
+        if any(status is None for status in statuses.values()):
+            await asyncio.sleep(poll)
+            poll = min(poll * 2, max_poll)
+
+
+class ActionCatalog():
+    """Actions of charms fetched once per upgrade.
+
+    Actions are stored by charm url, applications deployed from the same charm share
+    the listing and concurrent requests wait for the same query.
+    """
+
+    def __init__(self):
+        """Init action catalog."""
+        self.actions = {}
+
+    async def get(self, application):
+        """Return action names of the application charm."""
+        key = application.safe_data.get('charm-url') or application.name
+        if key not in self.actions:
+            self.actions[key] = asyncio.ensure_future(application.get_actions())
+        try:
+            actions = await asyncio.shield(self.actions[key])
+        except Exception:
+            # Failed queries are not cached
+            self.actions.pop(key, None)
+            raise
+        return actions.keys()
+
+    async def prefetch(self, applications):
+        """Fetch actions of the applications concurrently."""
+        results = await asyncio.gather(*[self.get(app) for app in applications], return_exceptions=True)
+        for app, result in zip(applications, results):
+            if isinstance(result, Exception):
+                log.warning('Failed to list actions of {}: {}'.format(app.name, result))
+
+
+async def enumerate_actions(application, catalog=None):
     """Enumerate available actions for the applications.
 
     Returns a list of actions.
 
     :param application: juju application
+    :param catalog: ActionCatalog shared during the upgrade
     """
+    if catalog is not None:
+        return await catalog.get(application)
     actions = await application.get_actions()
     return actions.keys()
 
 
-async def order_units(label, units):
+async def get_leaders(model, units=(), concurrency=8):
+    """Get leader units of applications.
+
+    Leadership of all applications is resolved with a single status query,
+    is-leader is probed concurrently on the units if the status is not available.
+
+    :param model: juju model
+    :param units: list of juju units probed if status query fails
+    :param concurrency: maximum number of concurrent probes
+    :return dict: application names and lists of leader unit names
+    """
+    leaders = {}
+    try:
+        status = await model.get_status()
+        for app_name, app_status in status.applications.items():
+            leaders.setdefault(app_name, [])
+            for unit_name, unit_status in (app_status.units or {}).items():
+                # Subordinate units are listed with their principal units
+                statuses = [(unit_name, unit_status)] + list((unit_status.subordinates or {}).items())
+                for name, entry in statuses:
+                    app_leaders = leaders.setdefault(name.split('/')[0], [])
+                    if entry.leader and name not in app_leaders:
+                        app_leaders.append(name)
+        return leaders
+    except Exception as e:
+        log.warning('Failed to query leaders from status, probing units: {}'.format(e))
+
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def _is_leader(unit):
+        async with semaphore:
+            action = await unit.run('is-leader')
+        results = action.data.get('results', {})
+        return results.get('Stdout', results.get('stdout', '')).strip() == 'True'
+
+    probes = await asyncio.gather(*[_is_leader(unit) for unit in units], return_exceptions=True)
+    for unit, is_leader in zip(units, probes):
+        if isinstance(is_leader, Exception):
+            log.warning('Failed to probe leadership of unit {}: {}'.format(unit.name, is_leader))
+        leaders.setdefault(unit.application, [])
+        if is_leader is True:
+            leaders[unit.application].append(unit.name)
+    return leaders
+
+
+async def order_units(label, units, leaders=None):
     """Determing order of units.
 
     Returns a list of units beginning with leader.
+    Units keep their order if the leader is ambiguous.
 
     :param label: string
     :param units: list of juju units
+    :param leaders: dict of leader unit names cached during the upgrade (see get_leaders)
     """
     log.info('{} - Determining order of units'.format(label))
-    ordered = []
-
-    is_leader_data = []
-    for unit in units:
-        is_leader_data.append(await unit.run('is-leader'))
-
-    leader_info = filter(
-        lambda u: u.data['results']['Stdout'].strip() == 'True',
-        is_leader_data
-    )
-    leader_unit = [x.data['receiver'] for x in leader_info][0]
+    if not units:
+        return []
+
+    leaders = {} if leaders is None else leaders
+    app_name = units[0].application
+    if app_name not in leaders:
+        leaders.update(await get_leaders(units[0].model, units))
+
+    app_leaders = leaders.get(app_name, [])
+    if len(app_leaders) != 1:
+        log.warning('{} - Leader is ambiguous ({}), keeping order of units'.format(
+            label, ', '.join(app_leaders) if app_leaders else 'none'
+        ))
+        return list(units)
 
-    for unit in units:
-        if unit.name == leader_unit:
-            ordered.insert(0, unit)
-        else:
-            ordered.append(unit)
+    leader_unit = app_leaders[0]
+    ordered = [unit for unit in units if unit.name == leader_unit]
+    ordered.extend([unit for unit in units if unit.name != leader_unit])
 
     log.info('{} - Upgrade order is: {} (leader){}{}'.format(
         label,
@@ -469,11 +782,19 @@ async def perform_upgrade(
     evacuate=False,
     rollable=False,
     pause=False,
-    origin='cloud:xenial-ocata'
+    origin='cloud:xenial-ocata',
+    max_unavailable=1,
+    max_failures=None,
+    wait_scope='related',
+    leaders=None,
+    journal=None,
+    catalog=None
 ):
     """Perform upgrade.
 
     Rolling upgrade is performed on the rollable application.
+    Leader is upgraded first, remaining units are upgraded in concurrent batches,
+    each batch waits for its units to react (agent status transition) and become ready.
 
     :param application: juju application
     :param dry_run: boolean
@@ -481,12 +802,21 @@ async def perform_upgrade(
     :param rollable: boolean
     :param pause: boolean
     :param origin: origin string
+    :param max_unavailable: number of units upgraded at once (batch size)
+    :param max_failures: number of failed units tolerated before further batches are stopped (None - unlimited)
+    :param wait_scope: applications to wait for after each batch (see get_wait_scope)
+    :param leaders: dict of leader unit names cached during the upgrade (see get_leaders)
+    :param journal: UpgradeJournal, config and units finished by previous run are skipped
+    :param catalog: ActionCatalog shared during the upgrade
+    :return int: number of failed units
     """
     label = application.name.upper()
     log.info('{} - Begin rolling upgrade'.format(label))
 
-    actions = await enumerate_actions(application)
-    if origin and not dry_run:
+    actions = await enumerate_actions(application, catalog=catalog)
+    if journal and journal.done('config', application.name):
+        log.info('{} - Config is already set'.format(label))
+    elif origin and not dry_run:
         config_key = origin_keys.get(application.name, 'openstack-origin')
         config = await application.get_config()
         previous = config.get(config_key, {}).get('value', '')
@@ -494,93 +824,137 @@ async def perform_upgrade(
         if previous == origin:
             current = previous
         else:
+            before = agent_status_times(application.units)
             await application.set_config({config_key: origin})
-            config_timeout = 60
-            config_is_set = False
-            while config_timeout > 0 and not config_is_set:
-                config_timeout = config_timeout - 1
-                await asyncio.sleep(5)
-                config = await application.get_config()
-                current = config.get(config_key, {}).get('value', '')
-                config_is_set = current == origin
-                log.info('{} - Setting config {} = {} => {}'.format(label, config_key, previous, current))
+            # Config of the application is part of its deltas, verified once converged (or timed out)
+            await wait_signal(
+                model,
+                lambda: (application.safe_data.get('config') or {}).get(config_key) == origin,
+                entity_types=['application'],
+                timeout=300,
+            )
+            # Units react to the config change with the config-changed hook
+            if not await wait_units_changed(model, application.units, before):
+                log.warning('{} - No status transition of units after config change'.format(label))
+            config = await application.get_config()
+            current = config.get(config_key, {}).get('value', '')
+            log.info('{} - Setting config {} = {} => {}'.format(label, config_key, previous, current))
+            if current != origin:
+                log.warn('{} - Config {} has not converged to {}'.format(label, config_key, origin))
         log.info('{} - Config {} = {}'.format(label, config_key, current))
+        if journal and current == origin:
+            journal.record('config', application.name)
 
-    ordered_units = await order_units(label, application.units) if rollable else application.units
+    ordered_units = await order_units(label, application.units, leaders=leaders) if rollable else application.units
     hacluster_pairs = get_hacluster_subordinate_pairs(application) if (rollable and pause) else {}  # TODO see fx
 
-    for unit in ordered_units:
+    if evacuate and application.name == 'nova-compute':
+        # NOT IMPLEMENTED
+        log.warn('{} - Nova evacuation is not implemented, app will be skipped'.format(label))
+        ordered_units = []
+
+    if journal:
+        finished = [unit.name for unit in ordered_units if journal.done('unit', unit.name)]
+        if finished:
+            log.info('{} - Skipping finished units: {}'.format(label, ', '.join(finished)))
+        ordered_units = [unit for unit in ordered_units if unit.name not in finished]
+
+    async def _run_actions(steps, timeout=None):
+        """Run actions on units concurrently, steps are (unit, action name, params)."""
+        if not steps or dry_run:
+            return False
+        async with async_timeout.timeout(timeout):
+            queued = await asyncio.gather(*[unit.run_action(name, **params) for unit, name, params in steps])
+            statuses = await wait_actions(model, queued)
+        for (unit, name, _), status in zip(steps, statuses):
+            log.debug('{} - Service action: {} on unit: {} status: {}'.format(label, name, unit.name, status))
+            if status in ACTION_FAILED:
+                raise Exception('Action {} failed on unit {}'.format(name, unit.name))
+        return True
+
+    async def _upgrade_unit(unit):
+        """Upgrade unit, returns True if any action was run."""
         hacluster_unit = hacluster_pairs.get(unit.name, False)
+        acted = False
 
-        if evacuate and application.name == 'nova-compute':
-            # NOT IMPLEMENTED
-            log.warn('{} - Nova evacuation is not implemented, app will be skipped'.format(label))
-            break
-
+        # Pause of the hacluster subordinate and the unit are independent,
+        # upgrade is queued as soon as both are paused
+        pauses = []
         if pause and hacluster_unit:
             # TODO this will pause all the units for hacluster subordinates
             log.info('{} - Pausing service on hacluster subordinate: {}'.format(label, hacluster_unit.name))
-            if not dry_run:
-                async with async_timeout.timeout(300):
-                    action = await hacluster_unit.run_action('pause')
-                    await action.wait()
-                    log.debug('{} - Service action: {} on unit: {} status: {}'.format(
-                        label, unit.name, 'pause', action.status
-                    ))
-            log.info('{} - Service on hacluster subordinate {} is paused'.format(label, hacluster_unit.name))
-
+            pauses.append((hacluster_unit, 'pause', {}))
         if pause and 'pause' in actions:
             log.info('{} - Pausing service on unit: {}'.format(label, unit.name))
-            if not dry_run:
-                async with async_timeout.timeout(300):
-                    action = await unit.run_action('pause')
-                    await action.wait()
-                    log.debug('{} - Service action: {} on unit: {} status: {}'.format(
-                        label, unit.name, 'pause', action.status
-                    ))
-            log.info('{} - Service on unit {} is paused'.format(label, unit.name))
-
-        if upgrade_action in actions:
-            log.info('{} - Upgrading service for unit: {}'.format(label, unit.name))
-            if not dry_run:
-                action = await unit.run_action(upgrade_action, **upgrade_params)
-                await action.wait()
-                log.debug('{} - Service action: {} on unit: {} status: {}'.format(
-                    label, unit.name, upgrade_action, action.status
-                ))
-            log.info('{} - Completed upgrade for unit: {}'.format(label, unit.name))
-
-        if pause and 'resume' in actions:
-            log.info('{} - Resuming service on unit: {}'.format(label, unit.name))
-            if not dry_run:
-                async with async_timeout.timeout(300):
-                    action = await unit.run_action('resume')
-                    await action.wait()
-                    log.debug('{} - Service action: {} on unit: {} status: {}'.format(
-                        label, unit.name, 'resume', action.status
-                    ))
-            log.info('{} - Service on unit {} has resumed'.format(label, unit.name))
-
-        if pause and hacluster_unit:
-            # TODO this will resume all the units for hacluster subordinates
-            log.info('{} - Resuming service on hacluster subordinate: {}'.format(label, hacluster_unit.name))
-            if not dry_run:
-                async with async_timeout.timeout(300):
-                    action = await hacluster_unit.run_action('resume')
-                    await action.wait()
-                    log.debug('{} - Service action: {} on unit: {} status: {}'.format(
-                        label, unit.name, 'resume', action.status
-                    ))
-            log.info('{} - Service on hacluster subordinate {} has resumed'.format(label, hacluster_unit.name))
-
+            pauses.append((unit, 'pause', {}))
+        try:
+            acted = await _run_actions(pauses, timeout=300)
+            for paused, _, _ in pauses:
+                log.info('{} - Service on {} is paused'.format(label, paused.name))
+
+            if upgrade_action in actions:
+                log.info('{} - Upgrading service for unit: {}'.format(label, unit.name))
+                acted = await _run_actions([(unit, upgrade_action, upgrade_params)], timeout=1800) or acted
+                log.info('{} - Completed upgrade for unit: {}'.format(label, unit.name))
+        finally:
+            # Services are resumed even if the pause or upgrade failed
+            resumes = []
+            if pause and 'resume' in actions:
+                log.info('{} - Resuming service on unit: {}'.format(label, unit.name))
+                resumes.append((unit, 'resume', {}))
+            if pause and hacluster_unit:
+                # TODO this will resume all the units for hacluster subordinates
+                log.info('{} - Resuming service on hacluster subordinate: {}'.format(label, hacluster_unit.name))
+                resumes.append((hacluster_unit, 'resume', {}))
+            acted = await _run_actions(resumes, timeout=300) or acted
+            for resumed, _, _ in resumes:
+                log.info('{} - Service on {} has resumed'.format(label, resumed.name))
+        return acted
+
+    # Leader is upgraded alone, remaining units in batches of max_unavailable units
+    batch_size = max(max_unavailable, 1)
+    first = 1 if rollable else batch_size
+    batches = [ordered_units[:first]] + [
+        ordered_units[idx:idx + batch_size] for idx in range(first, len(ordered_units), batch_size)
+    ]
+
+    failures = 0
+    for batch in batches:
+        if not batch:
+            continue
+        if len(batch) > 1:
+            log.info('{} - Upgrading batch: {}'.format(label, ', '.join([unit.name for unit in batch])))
+        before = agent_status_times(batch)
+        results = await asyncio.gather(*[_upgrade_unit(unit) for unit in batch], return_exceptions=True)
+
+        # Wait for the model to reflect the actions before evaluating readiness
+        acted = [unit for unit, result in zip(batch, results) if result is True]
+        if not await wait_units_changed(model, acted, before):
+            log.warning('{} - No status transition of units after upgrade: {}'.format(
+                label, ', '.join([unit.name for unit in acted])
+            ))
         await wait_until(
             model,
-            list(model.applications.values()),
+            get_wait_scope(model, application, wait_scope),
             timeout=1800,
             loop=model.loop
         )
-        log.info('{} - Unit {} has finished the upgrade'.format(label, unit.name))
-    log.info('{} - Finish rolling upgrade'.format(label))
+        for unit, result in zip(batch, results):
+            if isinstance(result, Exception):
+                failures += 1
+                log.error('{} - Unit {} failed the upgrade: {}'.format(label, unit.name, result))
+            else:
+                log.info('{} - Unit {} has finished the upgrade'.format(label, unit.name))
+                if journal:
+                    journal.record('unit', unit.name)
+
+        if max_failures is not None and failures > max_failures:
+            raise Exception('{} - Upgrade stopped after {} failed units'.format(label, failures))
+    if failures:
+        log.warning('{} - Finish rolling upgrade with {} failed units'.format(label, failures))
+    else:
+        log.info('{} - Finish rolling upgrade'.format(label))
+    return failures
 
 
 async def perform_bigbang_upgrade(
@@ -588,7 +962,8 @@ async def perform_bigbang_upgrade(
     origin_keys,
     dry_run=False,
     pause=False,
-    origin='cloud:xenial-ocata'
+    origin='cloud:xenial-ocata',
+    journal=None
 ):
     """Perform bigbang upgrade.
 
@@ -598,9 +973,12 @@ async def perform_bigbang_upgrade(
     :param dry_run: boolean
     :param pause: boolean
     :param origin: origin string
+    :param journal: UpgradeJournal, config set by previous run is skipped
     """
     log.info('Big-bang upgrade: {}'.format(application.name))
-    if origin and not dry_run:
+    if journal and journal.done('config', application.name):
+        log.info('Config of {} is already set'.format(application.name))
+    elif origin and not dry_run:
         config_key = origin_keys.get(application.name, 'openstack-origin')
         if config_key not in await application.get_config():
             log.warn('Unable to set source/origin during big-bang upgrade for service: {}'.format(application.name))
@@ -608,15 +986,24 @@ async def perform_bigbang_upgrade(
             return
 
         log.info('Set {} config {}={}'.format(application.name, config_key, origin))
+        before = [(u.agent_status_since, u.workload_status) for u in application.units]
         await application.set_config({config_key: origin})
-        await asyncio.sleep(15)
+        # Units react to the config change with a status transition (config-changed hook)
+        if not await wait_signal(
+            application.model,
+            lambda: [(u.agent_status_since, u.workload_status) for u in application.units] != before,
+            entity_types=['unit'],
+            timeout=60,
+        ):
+            log.warn('No status transition of {} units after config change'.format(application.name))
+        if journal:
+            journal.record('config', application.name)
 
     if not dry_run:
-        upgrade_in_progress = True
-        while upgrade_in_progress:
-            if any(
-                [u.workload_status.lower().find('upgrad') >= 0 for u in application.units]
-            ):
-                await asyncio.sleep(5)
-            else:
-                upgrade_in_progress = False
+        connected = await wait_for(
+            application.model,
+            lambda: not any(u.workload_status.lower().find('upgrad') >= 0 for u in application.units),
+            entity_types=['unit'],
+        )
+        if not connected:
+            raise websockets.ConnectionClosed(1006, 'no reason')
@@ -0,0 +1,256 @@
+import time
+import asyncio
+import logging
+import weakref
+from collections import Counter
+from contextlib import contextmanager
+
+from juju.status import derive_status
+
+
+log = logging.getLogger('jujuna.wait')
+
+_model_events = weakref.WeakKeyDictionary()
+
+
+class StatusAggregator():
+    """Status tallies of the model maintained from deltas.
+
+    Keeps application statuses and per application counts of unit workload statuses,
+    each delta is applied in constant time, so waiting and progress logging
+    do not iterate over all units of the model.
+
+    Time in the current application status is measured with monotonic clock from
+    the observed status change (initial state uses status timestamps of juju).
+
+    Status of applications which do not set it (unset) is derived from workload
+    statuses of their units, as libjuju does.
+    """
+
+    def __init__(self, model):
+        """Init aggregator from the current state of the model.
+
+        :param model: juju model
+        """
+        self.app_status = {}
+        self.app_since = {}
+        self.unit_status = {}
+        self.workload = {}
+        self.unset = set()
+        for app in model.applications.values():
+            if (app.safe_data.get('status') or {}).get('current') == 'unset':
+                self.unset.add(app.name)
+            self._set_app(app.name, app.status, self._since(app.safe_data.get('status', {}).get('since')))
+            for unit in app.units:
+                self._set_unit(unit.name, app.name, unit.workload_status)
+
+    @staticmethod
+    def _since(timestamp):
+        """Convert juju status timestamp to monotonic time."""
+        # helper depends on wait, imported on use
+        from jujuna.helper import parse_time
+
+        parsed = parse_time(timestamp) if timestamp else None
+        if parsed is None:
+            return None
+        return time.monotonic() - max(time.time() - parsed, 0)
+
+    def _set_app(self, name, status, since=None):
+        status = status or 'none'
+        if self.app_status.get(name) != status:
+            self.app_since[name] = since if since is not None else time.monotonic()
+        self.app_status[name] = status
+        self.workload.setdefault(name, Counter())
+
+    def _set_unit(self, name, app_name, status):
+        self._remove_unit(name)
+        self.unit_status[name] = (app_name, status or 'none')
+        self.workload.setdefault(app_name, Counter())[status or 'none'] += 1
+        self._derive_app(app_name)
+
+    def _remove_unit(self, name):
+        if name in self.unit_status:
+            app_name, status = self.unit_status.pop(name)
+            workload = self.workload.get(app_name)
+            if workload is None:
+                return
+            workload[status] -= 1
+            if not workload[status]:
+                del workload[status]
+            self._derive_app(app_name)
+
+    def _derive_app(self, name):
+        """Derive status of the application with unset status from its units."""
+        if name in self.unset:
+            self._set_app(name, derive_status(self.workload.get(name, {})))
+
+    def update(self, delta):
+        """Apply application or unit delta."""
+        data = delta.data or {}
+        name = data.get('name')
+        if not name:
+            return
+        if delta.entity == 'application':
+            if delta.type == 'remove':
+                self.app_status.pop(name, None)
+                self.app_since.pop(name, None)
+                self.workload.pop(name, None)
+                self.unset.discard(name)
+            elif (data.get('status') or {}).get('current') == 'unset':
+                self.unset.add(name)
+                self._derive_app(name)
+            else:
+                self.unset.discard(name)
+                self._set_app(name, (data.get('status') or {}).get('current'))
+        elif delta.entity == 'unit':
+            if delta.type == 'remove':
+                self._remove_unit(name)
+            else:
+                self._set_unit(name, data.get('application'), (data.get('workload-status') or {}).get('current'))
+
+    def app_statuses(self, app_names):
+        """Counter of application statuses."""
+        return Counter(self.app_status.get(name, 'none') for name in app_names)
+
+    def time_in_state(self, name):
+        """Time the application spent in its current status (s)."""
+        if name not in self.app_since:
+            return 0
+        return time.monotonic() - self.app_since[name]
+
+    def stuck(self, app_names, statuses=None, limit=None):
+        """Applications which are longest in a status other than active.
+
+        :param app_names: list of application names
+        :param statuses: only applications in these statuses, all but active if not specified
+        :param limit: maximum number of listed applications
+        :return list: tuples of application name, status and time in the status (s)
+        """
+        apps = [
+            (name, self.app_status[name], self.time_in_state(name)) for name in app_names
+            if name in self.app_status and (
+                self.app_status[name] in statuses if statuses else self.app_status[name] != 'active'
+            )
+        ]
+        apps.sort(key=lambda app: app[2], reverse=True)
+        return apps[:limit] if limit else apps
+
+    def workload_statuses(self, app_names):
+        """Counter of unit workload statuses of the applications."""
+        total = Counter()
+        for name in app_names:
+            total.update(self.workload.get(name, {}))
+        return total
+
+
+class ModelEvents():
+    """Model change notifications.
+
+    Registers a single observer per model (libjuju does not support removal of observers)
+    and notifies subscribed waiters about deltas of the entity types they watch.
+    """
+
+    def __init__(self, model):
+        """Init model events.
+
+        :param model: juju model
+        """
+        self.subscribers = set()
+        self.status = StatusAggregator(model)
+        model.add_observer(self._on_change)
+
+    async def _on_change(self, delta, old, new, model):
+        self.status.update(delta)
+        for entity_types, changed in list(self.subscribers):
+            if entity_types is None or delta.entity in entity_types:
+                changed.set()
+
+    @contextmanager
+    def subscribe(self, entity_types=None):
+        """Event set on every change of the entity types (e.g. application, unit, machine)."""
+        subscriber = (frozenset(entity_types) if entity_types else None, asyncio.Event())
+        self.subscribers.add(subscriber)
+        try:
+            yield subscriber[1]
+        finally:
+            self.subscribers.discard(subscriber)
+
+
+def model_events(model):
+    """Get change notifications of the model."""
+    if model not in _model_events:
+        _model_events[model] = ModelEvents(model)
+    return _model_events[model]
+
+
+def model_status(model):
+    """Get status tallies of the model (see StatusAggregator)."""
+    return model_events(model).status
+
+
+def is_disconnected(model):
+    return not (model.is_connected() and model.connection().is_open)
+
+
+async def wait_for(model, condition, entity_types=None, settle=0, log_time=None, log_func=None, heartbeat=5):
+    """Block until the condition is true.
+
+    Condition is evaluated when a relevant entity of the model changes instead of polling.
+    Heartbeat re-evaluates the condition (and connection) if there are no changes in the model,
+    e.g. for conditions depending on time. Condition may raise to stop waiting.
+
+    :param model: juju model
+    :param condition: callable returning boolean
+    :param entity_types: list of watched entity types, all if not specified
+    :param settle: condition has to stay true for this time (s)
+    :param log_time: logging frequency (s)
+    :param log_func: callable logging progress
+    :param heartbeat: maximum time between evaluations (s)
+    :return boolean: True if condition is met, False if model disconnected
+    """
+    with model_events(model).subscribe(entity_types) as changed:
+        satisfied_since = None
+        next_log = time.monotonic() + log_time if log_time else None
+        while not is_disconnected(model):
+            changed.clear()
+            now = time.monotonic()
+            if condition():
+                if satisfied_since is None:
+                    satisfied_since = now
+                if now - satisfied_since >= settle:
+                    return True
+            else:
+                satisfied_since = None
+
+            if next_log is not None and now >= next_log:
+                if log_func:
+                    log_func()
+                next_log = now + log_time
+
+            wake = [now + heartbeat]
+            if satisfied_since is not None:
+                wake.append(satisfied_since + settle)
+            if next_log is not None:
+                wake.append(next_log)
+            try:
+                await asyncio.wait_for(changed.wait(), max(min(wake) - now, 0))
+            except asyncio.TimeoutError:
+                pass
+    return False
+
+
+async def wait_signal(model, condition, entity_types=None, timeout=60):
+    """Wait for a completion signal with a timeout fallback.
+
+    Unlike wait_for the timeout is not an error, the caller decides how to proceed.
+
+    :param model: juju model
+    :param condition: callable returning boolean
+    :param entity_types: list of watched entity types, all if not specified
+    :param timeout: maximum waiting time (s)
+    :return boolean: True if condition is met, False on timeout or disconnect
+    """
+    try:
+        return await asyncio.wait_for(wait_for(model, condition, entity_types=entity_types), timeout)
+    except asyncio.TimeoutError:
+        return False
@@ -3,6 +3,7 @@ Tests for brokers.
 
 """
 
+import json
 import unittest
 from unittest.mock import patch
 from .asyncio_mocks import AsyncClassMock
@@ -10,6 +11,18 @@ from .asyncio_mocks import loop
 from jujuna.brokers.file import File
 
 
+class ExporterMock():
+
+    def __init__(self, path):
+        self.path = path
+
+    async def __aenter__(self):
+        return self.path
+
+    async def __aexit__(self, type, value, traceback):
+        pass
+
+
 class TestFileBroker(unittest.TestCase):
     """Test file broker.
 
@@ -24,3 +37,26 @@ class TestFileBroker(unittest.TestCase):
             fb.run({}, 'app-unit/0', 0)
         )
         self.assertEqual(var, [], var)
+
+    @patch('jujuna.brokers.Exporter')
+    def test_file_broker_batch(self, exporter):
+        """Testing file broker with all paths in one call."""
+        exporter.return_value = ExporterMock('/tmp/file.py')
+        stdout = json.dumps({
+            '/etc/hosts': {'/etc/hosts': {'is_reg': True}},
+            '/etc/*.conf': {'/etc/a.conf': {'is_reg': True}, '/etc/b.conf': {'is_reg': False}},
+            '/missing': {},
+        })
+        unit = AsyncClassMock(static=['run'])
+        unit.run.mock.return_value = AsyncClassMock(props={
+            'data': {'results': {'Code': '0', 'Stdout': stdout}}
+        })
+
+        var = loop(File().run({
+            '/etc/hosts': {'is_reg': True},
+            '/etc/*.conf': {'is_reg': True},
+            '/missing': {'is_reg': True},
+        }, unit, 0))
+
+        unit.run.mock.assert_called_once_with("python3 /tmp/file.py /etc/hosts '/etc/*.conf' /missing", timeout=10)
+        self.assertEqual([row[2] for row in var], [True, False, False])
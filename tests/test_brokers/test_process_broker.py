@@ -0,0 +1,85 @@
+"""
+Tests for brokers.
+
+"""
+
+import json
+import asyncio
+import unittest
+from unittest.mock import patch
+from .asyncio_mocks import AsyncClassMock
+from .asyncio_mocks import loop
+from jujuna.brokers.process import Process
+from jujuna.brokers.file import File
+from jujuna.exporters import ExporterResults
+
+
+class ExporterMock():
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    async def __aenter__(self):
+        return '/tmp/exporter.py'
+
+    async def __aexit__(self, type, value, traceback):
+        pass
+
+
+def unit_mock(name, machine, stdout):
+    unit = AsyncClassMock(static=['run'], props={'name': name, 'safe_data': {'machine-id': machine}})
+    unit.run.mock.return_value = AsyncClassMock(props={
+        'data': {'results': {'Code': '0', 'Stdout': json.dumps(stdout)}}
+    })
+    return unit
+
+
+class TestProcessBroker(unittest.TestCase):
+    """Test process broker.
+
+    """
+
+    @patch('jujuna.brokers.Exporter', new=ExporterMock)
+    def test_process_broker_machine_results(self):
+        """Testing process data collected once per machine."""
+        stdout = {'/usr/bin/python3': {'pid': '1', 'params': []}}
+        units = [unit_mock('app/0', '0', stdout), unit_mock('sub/0', '0', stdout), unit_mock('app/1', '1', stdout)]
+        results = ExporterResults()
+
+        rows = [
+            loop(Process(results=results).run({'/usr/bin/python3': True, 'nginx': False}, unit, idx))
+            for idx, unit in enumerate(units)
+        ]
+
+        self.assertTrue(all(row[2] for unit_rows in rows for row in unit_rows), rows)
+        self.assertEqual([unit.run.mock.call_count for unit in units], [1, 0, 1])
+
+    @patch('jujuna.brokers.Exporter', new=ExporterMock)
+    def test_file_broker_unit_results(self):
+        """Testing file data collected for every unit."""
+        units = [unit_mock('app/0', '0', {}), unit_mock('sub/0', '0', {})]
+        results = ExporterResults()
+
+        for idx, unit in enumerate(units):
+            loop(File(results=results).run({'/etc/hosts': {'is_reg': True}}, unit, idx))
+
+        self.assertEqual([unit.run.mock.call_count for unit in units], [1, 1])
+
+    @patch('jujuna.brokers.Exporter', new=ExporterMock)
+    def test_process_broker_failed_results(self):
+        """Testing failed export is not shared by units on the machine."""
+        stdout = {'/usr/bin/python3': {'pid': '1', 'params': []}}
+        units = [unit_mock('app/0', '0', stdout), unit_mock('sub/0', '0', stdout), unit_mock('app/1', '0', stdout)]
+        units[0].run.mock.side_effect = Exception('scp failed')
+        results = ExporterResults()
+
+        async def run():
+            return await asyncio.gather(
+                *[Process(results=results).export(unit) for unit in units[:2]], return_exceptions=True
+            )
+
+        failed, exported = loop(run())
+        self.assertIsInstance(failed, Exception)
+        self.assertEqual(exported, stdout)
+        self.assertEqual(loop(Process(results=results).export(units[2])), stdout)
+        self.assertEqual([unit.run.mock.call_count for unit in units], [1, 1, 0])
@@ -21,6 +21,10 @@ class TestArguments(unittest.TestCase):
         self.assertFalse(args['upgrade_only'])
         self.assertFalse(args['charms_only'])
         self.assertTrue(args['dry_run'])
+        self.assertEqual(args['parallel'], 1)
+        self.assertEqual(args['max_unavailable'], 1)
+        self.assertIsNone(args['max_failures'])
+        self.assertEqual(args['wait_scope'], 'related')
 
         self.assertEqual(args['model_name'], None)
         self.assertEqual(args['ctrl_name'], None)
@@ -47,3 +51,12 @@ class TestArguments(unittest.TestCase):
 
         self.assertEqual(args['upgrade_params'], {'version': 'luminuous'})
         self.assertEqual(args['origin_keys'], {'ceph': 'source'})
+
+    def test_args_test(self):
+        """Testing test parser."""
+        action, timeout, args = parse_args(['test', 'setup.py', '--parallel', '8', '--parallel-machine', '2'])
+        self.assertEqual(action, 'test')
+
+        self.assertEqual(args['parallel'], 8)
+        self.assertEqual(args['parallel_app'], 0)
+        self.assertEqual(args['parallel_machine'], 2)
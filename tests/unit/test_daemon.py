@@ -0,0 +1,130 @@
+"""
+Tests for connection daemon.
+
+"""
+
+import io
+import os
+import sys
+import asyncio
+import logging
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+from .asyncio_mocks import AsyncMock, loop
+from jujuna import helper
+from jujuna.daemon import serve, attach
+
+
+class TestDaemon(unittest.TestCase):
+    """Test daemon and shared connections.
+
+    """
+
+    def tearDown(self):
+        loop(helper.close_connections())
+
+    @patch('jujuna.helper._connect_juju', new=AsyncMock())
+    def test_shared_connections(self):
+        """Testing connections are reused and kept open."""
+        controller = MagicMock(disconnect=AsyncMock())
+        model = MagicMock(disconnect=AsyncMock())
+        model.is_connected.return_value = True
+        helper._connect_juju.mock.return_value = (controller, model)
+
+        helper.share_connections()
+        shared_controller, shared_model = loop(helper.connect_juju(model_name='test'))
+        self.assertIs(loop(helper.connect_juju(model_name='test'))[1], shared_model)
+        loop(shared_model.disconnect())
+        model.disconnect.mock.assert_not_called()
+        self.assertIs(shared_model.applications, model.applications)
+
+        model.is_connected.return_value = False
+        loop(helper.connect_juju(model_name='test'))
+        self.assertEqual(helper._connect_juju.mock.call_count, 2)
+
+        loop(helper.close_connections())
+        model.disconnect.mock.assert_called_once_with()
+        controller.disconnect.mock.assert_called_once_with()
+
+    @unittest.skipIf(sys.version_info < (3, 7), 'Daemon requires Python 3.7+')
+    @patch('jujuna.daemon.connect_juju', new=AsyncMock())
+    def test_serve_attach(self):
+        """Testing action run by daemon with logs streamed to client."""
+        received = {}
+
+        async def run_action(action, timeout, args):
+            received.update(action=action, suite=args['test_suite'].read(), parallel=args['parallel'])
+            logging.getLogger('jujuna.tests').info('running tests')
+            return 3
+
+        async def run(path, suite):
+            server = asyncio.ensure_future(serve(run_action, socket=path))
+            while not os.path.exists(path):
+                await asyncio.sleep(0.01)
+            try:
+                with open(suite) as stream:
+                    return await attach(path, 'test', 0, {'test_suite': stream, 'parallel': 2})
+            finally:
+                server.cancel()
+
+        disabled = logging.root.manager.disable
+        logging.disable(logging.NOTSET)
+        try:
+            with tempfile.TemporaryDirectory() as tmp, patch('sys.stdout', new_callable=io.StringIO) as stdout:
+                suite = os.path.join(tmp, 'suite.yaml')
+                with open(suite, 'w') as stream:
+                    stream.write('glance: {}')
+                ret = loop(run(os.path.join(tmp, 'daemon.sock'), suite))
+        finally:
+            logging.disable(disabled)
+
+        self.assertEqual(ret, 3)
+        self.assertEqual(received, {'action': 'test', 'suite': 'glance: {}', 'parallel': 2})
+        self.assertIn('running tests', stdout.getvalue())
+
+    @unittest.skipIf(sys.version_info < (3, 7), 'Daemon requires Python 3.7+')
+    @patch('jujuna.daemon.connect_juju', new=AsyncMock())
+    def test_serve_exclusive(self):
+        """Testing actions changing the model run one at a time."""
+        events = []
+
+        async def run_action(action, timeout, args):
+            events.append(('start', action))
+            await asyncio.sleep(0.05)
+            events.append(('end', action))
+            return 0
+
+        async def run(path):
+            server = asyncio.ensure_future(serve(run_action, socket=path))
+            while not os.path.exists(path):
+                await asyncio.sleep(0.01)
+            try:
+                with patch('sys.stdout', new_callable=io.StringIO):
+                    return await asyncio.gather(
+                        attach(path, 'upgrade', 0, {'model_name': 'test'}),
+                        attach(path, 'clean', 0, {'model_name': 'test'}),
+                        attach(path, 'test', 0, {'model_name': 'test'}),
+                    )
+            finally:
+                server.cancel()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            rets = loop(run(os.path.join(tmp, 'daemon.sock')))
+
+        self.assertEqual(rets, [0, 0, 0])
+        changes = [event for event in events if event[1] != 'test']
+        self.assertEqual([event[0] for event in changes], ['start', 'end', 'start', 'end'])
+        # test does not wait for actions changing the model
+        self.assertLess(events.index(('start', 'test')), events.index(('end', changes[0][1])))
+
+    @patch('jujuna.daemon.contextvars', new=None)
+    @patch('jujuna.daemon.connect_juju', new=AsyncMock())
+    def test_serve_unsupported(self):
+        """Testing daemon is not started without context variables (Python < 3.7)."""
+        from jujuna.daemon import connect_juju
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'daemon.sock')
+            self.assertEqual(loop(serve(AsyncMock(), socket=path)), 1)
+            self.assertFalse(os.path.exists(path))
+        connect_juju.mock.assert_not_called()
@@ -0,0 +1,150 @@
+"""
+Tests for exporter management.
+
+"""
+
+import sys
+import json
+import tempfile
+import subprocess
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+from .asyncio_mocks import AsyncMock, AsyncClassMock, loop
+from jujuna.exporters import build_bundle, ExporterBundles, Exporter
+from jujuna.exporters.package import dpkg_installed
+
+
+def unit_mock(name, machine):
+    unit = MagicMock()
+    unit.name = name
+    unit.safe_data = {'machine-id': machine}
+    return unit
+
+
+class TestExporterBundle(TestCase):
+    """Test exporter bundle.
+
+    """
+
+    def test_bundle_exporter(self):
+        """Testing exporter selected from the bundle."""
+        out = subprocess.check_output([sys.executable, build_bundle(), 'file', __file__])
+        self.assertTrue(json.loads(out.decode('utf-8'))[__file__][__file__]['is_reg'])
+
+    @patch('jujuna.exporters.Exporter._unload_exporter', new=AsyncMock())
+    @patch('jujuna.exporters.Exporter._load_exporter', new=AsyncMock())
+    def test_bundle_per_machine(self):
+        """Testing bundle shared by units on the same machine."""
+        units = [unit_mock('app/0', '0'), unit_mock('sub/0', '0'), unit_mock('app/1', '1')]
+        bundles = ExporterBundles('machine')
+
+        async def run():
+            paths = []
+            for unit in units:
+                async with Exporter(unit, 'file', bundles=bundles) as exporter:
+                    paths.append(exporter)
+            await bundles.close()
+            return paths
+
+        paths = loop(run())
+        self.assertEqual(paths[0], paths[1])
+        self.assertNotEqual(paths[0], paths[2])
+        self.assertTrue(paths[0].endswith('jujuna.pyz file'))
+        self.assertEqual(Exporter._load_exporter.mock.call_count, 2)
+        self.assertEqual(Exporter._unload_exporter.mock.call_count, 2)
+
+    def test_persistent_exporter(self):
+        """Testing upload of persistent exporter only when missing."""
+        def run_result(stdout):
+            return AsyncClassMock(props={'data': {'results': {'Code': '0', 'Stdout': stdout, 'Stderr': ''}}})
+
+        async def run(exporter):
+            async with exporter as path:
+                return path
+
+        unit = AsyncClassMock(static=['run', 'scp_to'])
+        unit.run.mock.return_value = run_result('present\n')
+        path = loop(run(Exporter(unit, 'file', persistent=True)))
+
+        self.assertTrue(path.startswith('/var/lib/jujuna/file/'))
+        self.assertEqual(unit.run.mock.call_count, 1)
+        unit.scp_to.mock.assert_not_called()
+        check = unit.run.mock.call_args[0][0]
+        self.assertIn('stat -c %u:%a /var/lib/jujuna)" = 0:700', check)
+        self.assertIn('sha256sum -c', check)
+
+        unit.run.mock.return_value = run_result('missing\n')
+        self.assertEqual(loop(run(Exporter(unit, 'file', persistent=True))), path)
+        self.assertEqual(unit.run.mock.call_count, 3)
+        unit.scp_to.mock.assert_called_once()
+        self.assertIn('mv ', unit.run.mock.call_args[0][0])
+        self.assertIn('sha256sum -c', unit.run.mock.call_args[0][0])
+
+    def test_persistent_exporter_unsafe_cache(self):
+        """Testing exporter uploaded for the run only if the cache is not usable."""
+        unit = AsyncClassMock(static=['run', 'scp_to'])
+        unit.run.mock.return_value = AsyncClassMock(props={
+            'data': {'results': {'Code': '1', 'Stdout': 'missing\n', 'Stderr': ''}}
+        })
+
+        async def run(exporter):
+            async with exporter as path:
+                return path
+
+        path = loop(run(Exporter(unit, 'file', persistent=True)))
+        self.assertTrue(path.startswith('/tmp/'))
+        self.assertEqual(unit.scp_to.mock.call_count, 2)
+        self.assertEqual(unit.scp_to.mock.call_args[0][1], path)
+        unit.run.mock.assert_called_with('rm {}'.format(path), timeout=14)
+
+    def test_inline_exporter(self):
+        """Testing exporter passed within the command."""
+        async def run(exporter):
+            async with exporter as path:
+                return path
+
+        unit = AsyncClassMock(static=['run', 'scp_to'])
+        options = loop(run(Exporter(unit, 'file', transport='inline')))
+        out = subprocess.check_output('{} {} {}'.format(sys.executable, options, __file__), shell=True)
+
+        self.assertTrue(json.loads(out.decode('utf-8'))[__file__][__file__]['is_reg'])
+        unit.run.mock.assert_not_called()
+        unit.scp_to.mock.assert_not_called()
+
+    def test_missing_exporter(self):
+        """Testing unknown exporter."""
+        with self.assertRaises(Exception):
+            Exporter(unit_mock('app/0', '0'), 'missing')
+
+
+DPKG_STATUS = """Package: bash
+Status: install ok installed
+Architecture: amd64
+Version: 5.0-6ubuntu1
+
+Package: nova-common
+Status: deinstall ok config-files
+Architecture: all
+Version: 2:21.0.0-0ubuntu0.20.04.1
+
+Package: libc6
+Status: install ok installed
+Architecture: amd64
+Version: 2.31-0ubuntu9
+"""
+
+
+class TestPackageExporter(TestCase):
+    """Test package exporter.
+
+    """
+
+    def test_dpkg_installed(self):
+        """Testing filtered packages from dpkg status."""
+        with tempfile.NamedTemporaryFile('w') as status:
+            status.write(DPKG_STATUS)
+            status.flush()
+            installed = dpkg_installed(['bash', 'nova-common', 'libc6:amd64', 'vim'], path=status.name)
+
+        self.assertEqual(sorted(installed.keys()), ['bash', 'libc6:amd64'])
+        self.assertEqual(installed['bash']['versions'], ['5.0-6ubuntu1'])
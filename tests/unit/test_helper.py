@@ -3,7 +3,9 @@ Tests for helper lib.
 
 """
 
-from jujuna.helper import cs_name_parse
+import os
+import tempfile
+from jujuna.helper import cs_name_parse, parse_time, UpgradeJournal
 import unittest
 
 
@@ -51,3 +53,26 @@ class TestArguments(unittest.TestCase):
         self.assertEqual(charm_id['charm'], '/tmp/glance-build')
         self.assertEqual(charm_id['revision'], None)
         self.assertEqual(charm_id['charmstore'], False)
+
+    def test_parse_time(self):
+        """Testing juju timestamps with timezones."""
+        utc = parse_time('2020-02-07T10:15:03.5Z')
+        self.assertEqual(utc, 1581070503.5)
+        self.assertEqual(parse_time('2020-02-07T11:15:03.500000000+01:00'), utc)
+        self.assertEqual(parse_time('2020-02-07T05:45:03.5-04:30'), utc)
+        self.assertEqual(parse_time('2020-02-07T10:15:03.5'), utc)
+        self.assertIsNone(parse_time('unknown'))
+
+    def test_upgrade_journal(self):
+        """Testing journal of finished upgrade steps."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'journal', '{model}-{origin}.json')
+            journal = UpgradeJournal('uuid', 'cloud:xenial-ocata', path=path)
+            journal.record('unit', 'glance/0')
+            self.assertTrue(os.path.exists(os.path.join(tmp, 'journal', 'uuid-cloud_xenial-ocata.json')))
+
+            resumed = UpgradeJournal('uuid', 'cloud:xenial-ocata', resume=True, path=path)
+            self.assertTrue(resumed.done('unit', 'glance/0'))
+            self.assertFalse(UpgradeJournal('uuid', 'cloud:xenial-ocata', path=path).done('unit', 'glance/0'))
+            other = UpgradeJournal('uuid', 'cloud:xenial-pike', resume=True, path=path)
+            self.assertFalse(other.done('unit', 'glance/0'))
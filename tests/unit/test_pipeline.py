@@ -0,0 +1,96 @@
+"""
+Tests for pipeline action.
+
+"""
+
+import io
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from .asyncio_mocks import AsyncMock, loop
+from jujuna.helper import SuiteError
+from jujuna.pipeline import load_job, pipeline
+
+
+class TestPipeline(unittest.TestCase):
+    """Test pipeline of stages.
+
+    """
+
+    def test_load_job(self):
+        """Testing job validation."""
+        stages = load_job(io.StringIO('stages: [clean, {test: {test_suite: suite.yaml}}]'))
+        self.assertEqual(stages, [('clean', {}), ('test', {'test_suite': 'suite.yaml'})])
+        invalid = [
+            'stages: {}', 'stages: [{unknown: {}}]', 'stages: [{test: [1]}]', 'stages: [{test: {}, clean: {}}]',
+            'stages: [{upgrade: {origin_keys: [ceph-mon]}}]',
+        ]
+        for job in invalid:
+            with self.assertRaises(SuiteError):
+                load_job(io.StringIO(job))
+
+    def test_load_job_args(self):
+        """Testing paths relative to the job file and key=value arguments."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'job.yaml')
+            with open(path, 'w') as stream:
+                stream.write(
+                    'stages:\n'
+                    '  - upgrade: {upgrade_params: "service=name,force", origin_keys: {ceph-mon: source}}\n'
+                    '  - test: {test_suite: suites/suite.yaml}\n'
+                    '  - deploy: {bundle_file: /bundle.yaml}\n'
+                )
+            with open(path, 'r') as stream:
+                stages = load_job(stream)
+        self.assertEqual(stages, [
+            ('upgrade', {'upgrade_params': {'service': 'name', 'force': True}, 'origin_keys': {'ceph-mon': 'source'}}),
+            ('test', {'test_suite': os.path.join(tmp, 'suites', 'suite.yaml')}),
+            ('deploy', {'bundle_file': '/bundle.yaml'}),
+        ])
+
+    @patch('jujuna.pipeline.close_connections', new=AsyncMock())
+    @patch('jujuna.pipeline.share_connections', new=lambda: True)
+    def test_pipeline_overlap(self):
+        """Testing upgraded apps are tested during the upgrade."""
+        from jujuna.pipeline import close_connections
+        calls = []
+
+        async def upgrade(on_upgraded=None, **kwargs):
+            calls.append(('upgrade', kwargs['origin'], kwargs['model_name']))
+            on_upgraded('glance')
+            on_upgraded('keystone')
+
+        async def test(apps=None, test_suite=None, **kwargs):
+            calls.append(('test', apps, test_suite.read()))
+
+        async def clean(**kwargs):
+            calls.append(('clean',))
+            return 1
+
+        async def deploy(**kwargs):
+            calls.append(('deploy',))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            suite = os.path.join(tmp, 'suite.yaml')
+            with open(suite, 'w') as stream:
+                stream.write('glance: {}\nnova: {}\n')
+            job = io.StringIO(
+                'stages:\n'
+                '  - upgrade: {{origin: "cloud:xenial-pike"}}\n'
+                '  - test: {{test_suite: {}, overlap: true}}\n'
+                '  - clean\n'
+                '  - deploy\n'.format(suite)
+            )
+            stages = {'upgrade': upgrade, 'test': test, 'clean': clean, 'deploy': deploy}
+            with patch.dict('jujuna.pipeline.STAGES', stages):
+                ret = loop(pipeline(job, model_name='test'))
+
+        self.assertEqual(ret, 1)
+        self.assertEqual(calls, [
+            ('upgrade', 'cloud:xenial-pike', 'test'),
+            ('test', ['glance'], 'glance: {}\nnova: {}\n'),
+            ('test', ['nova'], 'glance: {}\nnova: {}\n'),
+            ('clean',),
+        ])
+        close_connections.mock.assert_called_once_with()
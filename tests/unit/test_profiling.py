@@ -0,0 +1,57 @@
+"""
+Tests for test run profiling.
+
+"""
+
+import json
+import tempfile
+import unittest
+from jujuna.profiling import Profiler, percentile
+
+
+class TestProfiler(unittest.TestCase):
+    """Test profiler.
+
+    """
+
+    def test_percentile(self):
+        """Testing nearest-rank percentile."""
+        values = [float(x) for x in range(1, 101)]
+        self.assertEqual(percentile(values, 50), 50.0)
+        self.assertEqual(percentile(values, 95), 95.0)
+        self.assertEqual(percentile([3.0], 95), 3.0)
+        self.assertEqual(percentile([], 50), 0.0)
+
+    def test_remote_time(self):
+        """Testing remote time from juju action timestamps."""
+        profiler = Profiler()
+        profiler.record_action('file', 'app/0', {'started': '2020-02-07T10:15:01Z', 'completed': ''})
+        self.assertEqual(profiler.samples, [])
+        profiler.record_action('file', 'app/0', {
+            'started': '2020-02-07T10:15:01Z', 'completed': '2020-02-07T10:15:02Z'
+        })
+        self.assertEqual(profiler.samples, [('file', 'app/0', 'remote', 1.0)])
+        # Timestamps with different timezones
+        profiler.record_action('user', 'app/1', {
+            'started': '2020-02-07T11:15:01+01:00', 'completed': '2020-02-07T10:15:03.5Z'
+        })
+        self.assertEqual(profiler.samples[-1], ('user', 'app/1', 'remote', 2.5))
+
+    def test_summary(self):
+        """Testing summary per broker, phase of the broker and unit."""
+        profiler = Profiler()
+        profiler.record('file', 'app/0', 'total', 2.0)
+        profiler.record('file', 'app/1', 'total', 4.0)
+        profiler.record('user', 'app/1', 'total', 1.0)
+        profiler.record('file', 'app/0', 'upload', 0.5)
+        profiler.record('user', 'app/1', 'upload', 3.0)
+
+        with tempfile.NamedTemporaryFile('r') as output:
+            profiler.dump(output.name)
+            summary = json.load(output)['summary']
+
+        self.assertEqual(summary['brokers']['file']['count'], 2)
+        self.assertEqual(summary['brokers']['file']['max'], 4.0)
+        self.assertEqual(summary['phases']['file']['upload']['p50'], 0.5)
+        self.assertEqual(summary['phases']['user']['upload']['max'], 3.0)
+        self.assertEqual(list(summary['units'].keys()), ['app/1', 'app/0'])
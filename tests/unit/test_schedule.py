@@ -0,0 +1,74 @@
+"""
+Tests for dependency aware scheduling.
+
+"""
+
+import asyncio
+import unittest
+from .asyncio_mocks import loop
+from jujuna.schedule import build_dag, find_cycle, run_dag
+
+
+class TestSchedule(unittest.TestCase):
+    """Test upgrade scheduler.
+
+    """
+
+    def test_build_dag(self):
+        """Testing tiers, explicit edges and relations."""
+        apps = ['keystone', 'glance', 'cinder', 'cinder-ceph', 'openstack-dashboard']
+        order = {
+            'tiers': ['keystone', ['glance', 'cinder', 'missing']],
+            'after': {'cinder-ceph': 'cinder'},
+        }
+        dag = build_dag(apps, order, [('openstack-dashboard', 'cinder'), ('glance', 'keystone')])
+        self.assertEqual(dag, {
+            'keystone': set(),
+            'glance': {'keystone'},
+            'cinder': {'keystone'},
+            'cinder-ceph': {'cinder'},
+            'openstack-dashboard': {'cinder'},
+        })
+
+    def test_build_dag_relation_order(self):
+        """Testing relations do not contradict the ordering spec."""
+        dag = build_dag(['a', 'b'], {'after': {'a': ['b']}}, [('a', 'b')])
+        self.assertEqual(dag, {'a': {'b'}, 'b': set()})
+
+    def test_build_dag_cycle(self):
+        """Testing cyclic ordering spec."""
+        self.assertEqual(find_cycle({'a': {'b'}, 'b': {'a'}}), ['a', 'b', 'a'])
+        with self.assertRaises(ValueError):
+            build_dag(['a', 'b'], {'after': {'a': ['b'], 'b': ['a']}})
+
+    def test_run_dag(self):
+        """Testing concurrency limit and dependencies."""
+        dag = {'a': set(), 'b': set(), 'c': set(), 'd': {'a'}}
+        state = {'running': 0, 'max': 0}
+        finished = []
+
+        async def func(name):
+            state['running'] += 1
+            state['max'] = max(state['max'], state['running'])
+            if name == 'd':
+                self.assertIn('a', finished)
+            await asyncio.sleep(0.01)
+            finished.append(name)
+            state['running'] -= 1
+
+        self.assertEqual(loop(run_dag(dag, func, parallel=2)), {'a', 'b', 'c', 'd'})
+        self.assertEqual(state['max'], 2)
+        self.assertEqual(finished[:2], ['a', 'b'])
+
+    def test_run_dag_failure(self):
+        """Testing failure stops scheduling of other applications."""
+        started = []
+
+        async def func(name):
+            started.append(name)
+            if name == 'a':
+                raise Exception('failed')
+
+        with self.assertRaises(Exception):
+            loop(run_dag({'a': set(), 'b': {'a'}, 'c': set()}, func, parallel=1))
+        self.assertEqual(started, ['a'])
@@ -0,0 +1,85 @@
+"""
+Tests for command line startup.
+
+"""
+
+import os
+import sys
+import time
+import tempfile
+import unittest
+import subprocess
+
+
+# Modules needed only by actions, not by help or shell completion
+HEAVY_MODULES = ['juju', 'theblues', 'websockets', 'yaml', 'paramiko', 'jujuna.brokers', 'jujuna.helper']
+
+# Cold start bound of the opt-in benchmark (JUJUNA_BENCHMARK=1)
+STARTUP_LIMIT = float(os.environ.get('JUJUNA_STARTUP_LIMIT', 1.0))
+
+COMPLETION_ENV = {
+    '_ARGCOMPLETE': '1',
+    'COMP_LINE': 'jujuna up',
+    'COMP_POINT': '9',
+}
+
+
+def run_jujuna(argv, env=None):
+    """Run jujuna in a new interpreter.
+
+    :return tuple: elapsed seconds, set of imported modules
+    """
+    start = time.monotonic()
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-m', 'jujuna'] + argv,
+        env=dict(os.environ, **(env or {})),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        timeout=60,
+    )
+    elapsed = time.monotonic() - start
+    modules = set(
+        line.rsplit('|', 1)[-1].strip() for line in proc.stderr.splitlines() if line.startswith('import time:')
+    )
+    return elapsed, modules
+
+
+@unittest.skipIf(sys.version_info < (3, 7), 'Import times are reported since Python 3.7 (-X importtime)')
+class TestStartup(unittest.TestCase):
+    """Test cold start of help and shell completion.
+
+    """
+
+    def assertLight(self, modules):
+        for name in HEAVY_MODULES:
+            self.assertFalse(
+                [m for m in modules if m == name or m.startswith(name + '.')],
+                msg='{} imported on startup'.format(name)
+            )
+
+    def test_startup_help(self):
+        """Testing help does not import actions."""
+        _, modules = run_jujuna(['--help'])
+        self.assertIn('jujuna.settings', modules)
+        self.assertLight(modules)
+
+    def test_startup_completion(self):
+        """Testing shell completion does not import actions."""
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'completion')
+            _, modules = run_jujuna([], env=dict(COMPLETION_ENV, _ARGCOMPLETE_STDOUT_FILENAME=output))
+            with open(output) as f:
+                completions = f.read()
+        self.assertIn('upgrade', completions)
+        self.assertLight(modules)
+
+    @unittest.skipUnless(os.environ.get('JUJUNA_BENCHMARK'), 'Startup benchmark (set JUJUNA_BENCHMARK=1)')
+    def test_startup_benchmark(self):
+        """Benchmark cold start of help and shell completion (best of 5 runs)."""
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(COMPLETION_ENV, _ARGCOMPLETE_STDOUT_FILENAME=os.path.join(tmp, 'completion'))
+            for label, argv, run_env in [('help', ['--help'], None), ('completion', [], env)]:
+                elapsed = min(run_jujuna(argv, env=run_env)[0] for _ in range(5))
+                print('Startup {}: {:.3f}s'.format(label, elapsed))
+                self.assertLess(elapsed, STARTUP_LIMIT)
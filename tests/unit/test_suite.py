@@ -0,0 +1,70 @@
+"""
+Tests for test suite compiler.
+
+"""
+
+import unittest
+from jujuna.helper import SuiteError
+from jujuna.suite import load_suite, compile_suite, count_checks
+from jujuna.brokers.mount import Mount
+from jujuna.suite import logging
+logging.disable(logging.CRITICAL)
+
+
+SUITE = """
+keystone:
+  file:
+    /etc/keystone/keystone.conf:
+      is_reg: true
+      imode: 416
+  mount:
+    regex:
+      - '^/dev/vd[a-z]1$'
+  process:
+    /usr/sbin/apache2: true
+  unknown:
+    key: value
+ceph-osd:
+  package:
+    installed:
+      - ceph-osd
+      - ceph-common
+"""
+
+
+class TestSuite(unittest.TestCase):
+    """Test suite compiler.
+
+    """
+
+    def test_compile_suite(self):
+        """Testing execution plan."""
+        plan = load_suite(SUITE)
+
+        self.assertEqual(sorted(plan.keys()), ['ceph-osd', 'keystone'])
+        self.assertEqual([name for name, _, _ in plan['keystone']], ['file', 'mount', 'process'])
+        name, broker, checks = plan['keystone'][1]
+        self.assertIs(broker, Mount)
+        self.assertTrue(checks['regex'][0].search('/dev/vdb1'))
+        self.assertEqual(sum(count_checks(checks) for _, _, checks in plan['keystone']), 4)
+        self.assertEqual(count_checks(plan['ceph-osd'][0][2]), 2)
+
+    def test_plan_immutable(self):
+        """Testing plan cannot be modified."""
+        plan = load_suite(SUITE)
+        checks = plan['keystone'][0][2]
+        with self.assertRaises(TypeError):
+            checks['/etc/keystone/keystone.conf']['is_reg'] = False
+        with self.assertRaises(TypeError):
+            plan['nova'] = ()
+
+    def test_invalid_suite(self):
+        """Testing validation of test suite."""
+        with self.assertRaises(SuiteError):
+            compile_suite(['keystone'])
+        with self.assertRaises(SuiteError):
+            compile_suite({'keystone': {'process': {'apache2': 'yes'}}})
+        with self.assertRaises(SuiteError):
+            compile_suite({'keystone': {'mount': {'regex': ['[']}}})
+        with self.assertRaises(SuiteError):
+            compile_suite({'keystone': {'package': {'installed': 'ceph'}}})
@@ -0,0 +1,75 @@
+"""
+Tests for test action.
+
+"""
+
+import asyncio
+from unittest import TestCase
+from unittest.mock import MagicMock
+from .asyncio_mocks import loop
+from jujuna.tests import UnitScheduler, report_results
+from jujuna.tests import logging
+logging.disable(logging.CRITICAL)
+
+
+def unit_mock(name, machine):
+    unit = MagicMock()
+    unit.name = name
+    unit.entity_id = name
+    unit.safe_data = {'machine-id': machine}
+    return unit
+
+
+class TestUnitScheduler(TestCase):
+    """Test concurrent execution of unit tests.
+
+    """
+
+    def run_units(self, scheduler, units):
+        running = {'all': 0, 'app': {}, 'machine': {}}
+        peak = {'all': 0, 'app': {}, 'machine': {}}
+
+        async def job(app_name, unit, delay):
+            machine = unit.safe_data['machine-id']
+            running['all'] += 1
+            running['app'][app_name] = running['app'].get(app_name, 0) + 1
+            running['machine'][machine] = running['machine'].get(machine, 0) + 1
+            peak['all'] = max(peak['all'], running['all'])
+            peak['app'][app_name] = max(peak['app'].get(app_name, 0), running['app'][app_name])
+            peak['machine'][machine] = max(peak['machine'].get(machine, 0), running['machine'][machine])
+            await asyncio.sleep(delay)
+            running['all'] -= 1
+            running['app'][app_name] -= 1
+            running['machine'][machine] -= 1
+            return unit.name
+
+        async def run_all():
+            return await asyncio.gather(*[
+                scheduler.run(app_name, unit, job, app_name, unit, 0.01 * (len(units) - idx))
+                for idx, (app_name, unit) in enumerate(units)
+            ])
+
+        return loop(run_all()), peak
+
+    def test_parallel_limit(self):
+        """Testing total limit and order of results."""
+        units = [('app{}'.format(i % 3), unit_mock('app{}/{}'.format(i % 3, i), str(i))) for i in range(9)]
+        results, peak = self.run_units(UnitScheduler(parallel=4), units)
+
+        self.assertEqual(results, [unit.name for _, unit in units])
+        self.assertEqual(peak['all'], 4)
+
+    def test_app_machine_limits(self):
+        """Testing per application and per machine limits."""
+        units = [('app{}'.format(i % 3), unit_mock('app{}/{}'.format(i % 3, i), str(i % 2))) for i in range(12)]
+        results, peak = self.run_units(UnitScheduler(parallel=12, parallel_app=2, parallel_machine=3), units)
+
+        self.assertEqual(results, [unit.name for _, unit in units])
+        self.assertTrue(all(count <= 2 for count in peak['app'].values()), peak)
+        self.assertTrue(all(count <= 3 for count in peak['machine'].values()), peak)
+
+    def test_report_results(self):
+        """Testing counting of results."""
+        unit = unit_mock('app/0', '0')
+        results = [('file', (0, 'a', True)), ('file', (0, 'b', False)), ('user', (0, 'c', True))]
+        self.assertEqual(report_results(unit, results), (2, 1))
@@ -3,16 +3,25 @@ Tests for upgrade action.
 
 """
 
+import asyncio
 from jujuna.helper import cs_name_parse
-from jujuna.upgrade import upgrade, upgrade_charms, perform_upgrade
-from unittest.mock import patch
+from jujuna.upgrade import upgrade, upgrade_charms, perform_upgrade, resolve_revisions, get_wait_scope
+from jujuna.upgrade import perform_bigbang_upgrade
+from jujuna.helper import CharmstoreCache
+from jujuna.settings import UPGRADE_ORDER
+from unittest.mock import patch, ANY, MagicMock
 from unittest import TestCase
 from collections import namedtuple
 from .asyncio_mocks import AsyncMock, AsyncClassMock, loop
+from .test_wait import ModelMock
 from jujuna.upgrade import logging
 logging.disable(logging.CRITICAL)
 
 
+async def wait_actions_mock(model, actions):
+    return [action.status for action in actions]
+
+
 def unit_mock(**kwargs):
     namedtuple('Unit', ['name'])
 
@@ -27,8 +36,9 @@ class TestUpgrade(TestCase):
     @patch('jujuna.upgrade.connect_juju', new=AsyncMock())
     @patch('jujuna.upgrade.upgrade_charms', new=AsyncMock())
     @patch('jujuna.upgrade.upgrade_services', new=AsyncMock())
+    @patch('jujuna.upgrade.UpgradeJournal')
     def test_perform_upgrade_call(
-        self
+        self, UpgradeJournal
     ):
         """Testing upgrade parser."""
         from jujuna.upgrade import connect_juju, upgrade_charms, upgrade_services
@@ -43,7 +53,7 @@ class TestUpgrade(TestCase):
         app2 = AsyncClassMock(static=['status'])
         model = AsyncClassMock(
             static=['disconnect'],
-            props={'applications': {'test': app1, 'glance': app2}}
+            props={'applications': {'test': app1, 'glance': app2}, 'info': MagicMock(uuid='uuid')}
         )
         controller = AsyncClassMock(static=['disconnect'])
 
@@ -55,19 +65,24 @@ class TestUpgrade(TestCase):
         ))
 
         upgrade_charms.mock.assert_called_once_with(
-            model, upgrade_apps_cs, False, False
+            model, upgrade_apps_cs, False, False, lookup_concurrency=8, charmstore_cache=ANY,
+            journal=UpgradeJournal.return_value
         )
         upgrade_services.mock.assert_called_once_with(
-            model, upgrade_srvcs, '', 'origin_keys', '', {}, False, False
+            model, upgrade_srvcs, '', 'origin_keys', '', {}, False, False,
+            parallel=1, upgrade_order=UPGRADE_ORDER, max_unavailable=1, max_failures=None,
+            wait_scope='related', journal=UpgradeJournal.return_value, on_upgraded=None
         )
+        UpgradeJournal.assert_called_once_with('uuid', '', resume=False)
 
     @patch('asyncio.sleep', new=AsyncMock())
     @patch('jujuna.upgrade.wait_until', new=AsyncMock())
+    @patch('jujuna.upgrade.wait_signal', new=AsyncMock(return_value=True))
     def test_perform_upgrade_charms(
         self
     ):
         """Testing upgrade parser."""
-        from jujuna.upgrade import wait_until
+        from jujuna.upgrade import wait_until, wait_signal
 
         upgrade_apps = [cs_name_parse('cs:xenial/test-12'), cs_name_parse('glance')]
 
@@ -99,9 +114,43 @@ class TestUpgrade(TestCase):
         wait_until.mock.assert_called_once_with(
             model, list(model.applications.values()), timeout=1800
         )
-
+        # charm url change of each application and units finishing the upgrade
+        self.assertEqual(wait_signal.mock.call_count, 3)
+        asyncio.sleep.mock.assert_not_called()
+
+    def test_resolve_revisions(self):
+        """Testing charmstore lookups once per charm with cache."""
+        apps = [cs_name_parse(name) for name in ['glance', 'ceph-osd', 'ceph-osd-ssd', 'cs:xenial/test-12', 'nova']]
+
+        def app_mock(charm_url):
+            return AsyncClassMock(props={'data': {'charm-url': charm_url}})
+
+        model = AsyncClassMock(props={'applications': {
+            'glance': app_mock('cs:xenial/glance-49'),
+            'ceph-osd': app_mock('cs:xenial/ceph-osd-10'),
+            'ceph-osd-ssd': app_mock('cs:xenial/ceph-osd-10'),
+            'test': app_mock('cs:xenial/test-3'),
+        }})
+        model.charmstore = AsyncClassMock(static=['entity'])
+        model.charmstore.entity.mock.side_effect = lambda charm, **kwargs: {
+            'glance': {'Id': 'cs:xenial/glance-52'}, 'ceph-osd': {'Id': 'cs:xenial/ceph-osd-12'}
+        }[charm]
+
+        cache = CharmstoreCache(path='/nonexistent/charmstore.json', ttl=60)
+        cache.save = lambda: None
+        revisions = loop(resolve_revisions(model, apps, concurrency=2, cache=cache))
+
+        self.assertEqual(revisions, {'glance': 52, 'ceph-osd': 12})
+        self.assertEqual(model.charmstore.entity.mock.call_count, 2)
+
+        revisions = loop(resolve_revisions(model, apps, concurrency=2, cache=cache))
+        self.assertEqual(revisions, {'glance': 52, 'ceph-osd': 12})
+        self.assertEqual(model.charmstore.entity.mock.call_count, 2)
+
+    @patch('jujuna.upgrade.wait_actions', new=wait_actions_mock)
     @patch('asyncio.sleep', new=AsyncMock())
     @patch('jujuna.upgrade.wait_until', new=AsyncMock())
+    @patch('jujuna.upgrade.wait_signal', new=AsyncMock(return_value=True))
     @patch('jujuna.upgrade.enumerate_actions', new=AsyncMock(return_value=['openstack-upgrade']))
     def test_perform_upgrade_simple(
         self  # , get_hacluster_subordinate_pairs
@@ -118,7 +167,7 @@ class TestUpgrade(TestCase):
         def func(*args, **kwargs):
             return ORIGIN_CONFIG.pop()
 
-        unit = AsyncClassMock(static=['run_action'], props={'name': 'test/0'})
+        unit = AsyncClassMock(static=['run_action'], props={'name': 'test/0', 'agent_status_since': None})
         app = AsyncClassMock(
             static=['set_config', 'get_config'],
             props={'name': 'test', 'units': [unit], 'relations': []}
@@ -144,13 +193,15 @@ class TestUpgrade(TestCase):
             origin=origin
         ))
         app.set_config.mock.assert_called_once_with({'openstack-origin': origin})
-        enumerate_actions.mock.assert_called_once_with(app)
+        enumerate_actions.mock.assert_called_once_with(app, catalog=None)
         unit.run_action.mock.assert_called_once_with(upgrade_action)
         wait_until.mock.assert_called_once_with(model, list(model.applications.values()), loop=None, timeout=1800)
 
+    @patch('jujuna.upgrade.wait_actions', new=wait_actions_mock)
     @patch('asyncio.sleep', new=AsyncMock())
     @patch('jujuna.upgrade.get_hacluster_subordinate_pairs')
     @patch('jujuna.upgrade.wait_until', new=AsyncMock())
+    @patch('jujuna.upgrade.wait_signal', new=AsyncMock(return_value=True))
     @patch('jujuna.upgrade.order_units', new=AsyncMock())
     @patch('jujuna.upgrade.enumerate_actions', new=AsyncMock(return_value=['openstack-upgrade', 'pause', 'resume']))
     def test_perform_upgrade_rolling(
@@ -169,7 +220,7 @@ class TestUpgrade(TestCase):
         def func(*args, **kwargs):
             return ORIGIN_CONFIG.pop()
 
-        unit = AsyncClassMock(static=['run_action'], props={'name': 'test/0'})
+        unit = AsyncClassMock(static=['run_action'], props={'name': 'test/0', 'agent_status_since': None})
         app = AsyncClassMock(
             static=['set_config', 'get_config'],
             props={'name': 'test', 'units': [unit], 'relations': []}
@@ -197,16 +248,18 @@ class TestUpgrade(TestCase):
             origin=origin
         ))
         app.set_config.mock.assert_called_once_with({'openstack-origin': origin})
-        enumerate_actions.mock.assert_called_once_with(app)
-        order_units.mock.assert_called_once_with(app.name.upper(), app.units)
+        enumerate_actions.mock.assert_called_once_with(app, catalog=None)
+        order_units.mock.assert_called_once_with(app.name.upper(), app.units, leaders=None)
         unit.run_action.mock.assert_any_call('pause')
         unit.run_action.mock.assert_any_call(upgrade_action)
         unit.run_action.mock.assert_called_with('resume')
         wait_until.mock.assert_called_once_with(model, list(model.applications.values()), loop=None, timeout=1800)
 
+    @patch('jujuna.upgrade.wait_actions', new=wait_actions_mock)
     @patch('asyncio.sleep', new=AsyncMock())
     @patch('jujuna.upgrade.get_hacluster_subordinate_pairs')
     @patch('jujuna.upgrade.wait_until', new=AsyncMock())
+    @patch('jujuna.upgrade.wait_signal', new=AsyncMock(return_value=True))
     @patch('jujuna.upgrade.order_units', new=AsyncMock())
     @patch('jujuna.upgrade.enumerate_actions', new=AsyncMock(return_value=['openstack-upgrade', 'pause', 'resume']))
     def test_perform_upgrade_rolling_ha(
@@ -225,9 +278,9 @@ class TestUpgrade(TestCase):
         def func(*args, **kwargs):
             return ORIGIN_CONFIG.pop()
 
-        unit0 = AsyncClassMock(static=['run_action'], props={'name': 'test/0'})
-        unit1 = AsyncClassMock(static=['run_action'], props={'name': 'test/1'})
-        unit2 = AsyncClassMock(static=['run_action'], props={'name': 'test/2'})
+        unit0 = AsyncClassMock(static=['run_action'], props={'name': 'test/0', 'agent_status_since': None})
+        unit1 = AsyncClassMock(static=['run_action'], props={'name': 'test/1', 'agent_status_since': None})
+        unit2 = AsyncClassMock(static=['run_action'], props={'name': 'test/2', 'agent_status_since': None})
 
         unit0.run_action.mock.return_value = AsyncClassMock(static=['wait', 'status'], props={'results': 'results'})
         unit1.run_action.mock.return_value = AsyncClassMock(static=['wait', 'status'], props={'results': 'results'})
@@ -270,8 +323,8 @@ class TestUpgrade(TestCase):
             origin=origin
         ))
         app.set_config.mock.assert_called_once_with({'openstack-origin': origin})
-        enumerate_actions.mock.assert_called_once_with(app)
-        order_units.mock.assert_called_once_with(app.name.upper(), app.units)
+        enumerate_actions.mock.assert_called_once_with(app, catalog=None)
+        order_units.mock.assert_called_once_with(app.name.upper(), app.units, leaders=None)
         get_hacluster_subordinate_pairs.assert_called_once_with(app)
 
         for unit in units:
@@ -284,3 +337,360 @@ class TestUpgrade(TestCase):
             unit_ha.run_action.mock.assert_called_with('resume')
 
         wait_until.mock.assert_called_with(model, list(model.applications.values()), loop=None, timeout=1800)
+
+    @patch('jujuna.upgrade.wait_actions', new=wait_actions_mock)
+    @patch('asyncio.sleep', new=AsyncMock())
+    @patch('jujuna.upgrade.get_hacluster_subordinate_pairs', new=lambda app: {})
+    @patch('jujuna.upgrade.wait_until', new=AsyncMock())
+    @patch('jujuna.upgrade.wait_signal', new=AsyncMock(return_value=True))
+    @patch('jujuna.upgrade.order_units', new=AsyncMock())
+    @patch('jujuna.upgrade.enumerate_actions', new=AsyncMock(return_value=['openstack-upgrade', 'pause', 'resume']))
+    def test_perform_upgrade_batches(self):
+        """Testing leader first and batches of remaining units."""
+        from jujuna.upgrade import wait_until
+        from jujuna.upgrade import order_units
+
+        units = []
+        for idx in range(5):
+            unit = AsyncClassMock(
+                static=['run_action'], props={'name': 'test/{}'.format(idx), 'agent_status_since': None}
+            )
+            unit.run_action.mock.return_value = AsyncClassMock(static=['wait'], props={'status': 'completed'})
+            units.append(unit)
+        app = AsyncClassMock(props={'name': 'test', 'units': units, 'relations': []})
+        model = AsyncClassMock(props={'applications': {'test': app}, 'loop': None})
+        order_units.mock.return_value = units
+
+        loop(perform_upgrade(
+            model, app, {}, 'openstack-upgrade', {}, rollable=True, pause=True, origin='', max_unavailable=2
+        ))
+        # leader, 2 batches of 2 units
+        self.assertEqual(wait_until.mock.call_count, 3)
+        for unit in units:
+            unit.run_action.mock.assert_any_call('openstack-upgrade')
+            unit.run_action.mock.assert_called_with('resume')
+
+    @patch('jujuna.upgrade.wait_actions', new=wait_actions_mock)
+    @patch('asyncio.sleep', new=AsyncMock())
+    @patch('jujuna.upgrade.get_hacluster_subordinate_pairs', new=lambda app: {})
+    @patch('jujuna.upgrade.wait_until', new=AsyncMock())
+    @patch('jujuna.upgrade.wait_signal', new=AsyncMock(return_value=True))
+    @patch('jujuna.upgrade.order_units', new=AsyncMock())
+    @patch('jujuna.upgrade.enumerate_actions', new=AsyncMock(return_value=['openstack-upgrade']))
+    def test_perform_upgrade_max_failures(self):
+        """Testing failure threshold stops further batches."""
+        from jujuna.upgrade import order_units
+
+        units = []
+        for idx in range(5):
+            unit = AsyncClassMock(
+                static=['run_action'], props={'name': 'test/{}'.format(idx), 'agent_status_since': None}
+            )
+            unit.run_action.mock.return_value = AsyncClassMock(
+                static=['wait'], props={'status': 'failed' if idx in (1, 2) else 'completed'}
+            )
+            units.append(unit)
+        app = AsyncClassMock(props={'name': 'test', 'units': units, 'relations': []})
+        model = AsyncClassMock(props={'applications': {'test': app}, 'loop': None})
+        order_units.mock.return_value = units
+
+        with self.assertRaises(Exception):
+            loop(perform_upgrade(
+                model, app, {}, 'openstack-upgrade', {}, rollable=True, origin='', max_unavailable=2, max_failures=1
+            ))
+        for unit in units[:3]:
+            unit.run_action.mock.assert_called_once_with('openstack-upgrade')
+        for unit in units[3:]:
+            unit.run_action.mock.assert_not_called()
+
+    @patch('jujuna.upgrade.wait_actions', new=wait_actions_mock)
+    @patch('asyncio.sleep', new=AsyncMock())
+    @patch('jujuna.upgrade.get_hacluster_subordinate_pairs')
+    @patch('jujuna.upgrade.wait_until', new=AsyncMock())
+    @patch('jujuna.upgrade.wait_signal', new=AsyncMock(return_value=True))
+    @patch('jujuna.upgrade.order_units', new=AsyncMock())
+    @patch('jujuna.upgrade.enumerate_actions', new=AsyncMock(return_value=['openstack-upgrade', 'pause', 'resume']))
+    def test_perform_upgrade_pause_failed(self, get_hacluster_subordinate_pairs):
+        """Testing failed pause resumes the unit and upgrade continues with other units."""
+        from jujuna.upgrade import order_units
+
+        def action(name, **params):
+            return AsyncClassMock(static=['wait'], props={'status': 'failed' if name == 'pause' else 'completed'})
+
+        units = []
+        units_ha = []
+        for idx in range(3):
+            unit = AsyncClassMock(
+                static=['run_action'], props={'name': 'test/{}'.format(idx), 'agent_status_since': None}
+            )
+            unit_ha = AsyncClassMock(static=['run_action'], props={'name': 'test-hacluster/{}'.format(idx)})
+            unit_ha.run_action.mock.return_value = AsyncClassMock(static=['wait'], props={'status': 'completed'})
+            units.append(unit)
+            units_ha.append(unit_ha)
+        units[0].run_action.mock.side_effect = action
+        for unit in units[1:]:
+            unit.run_action.mock.return_value = AsyncClassMock(static=['wait'], props={'status': 'completed'})
+        app = AsyncClassMock(props={'name': 'test', 'units': units, 'relations': []})
+        model = AsyncClassMock(props={'applications': {'test': app}, 'loop': None})
+        order_units.mock.return_value = units
+        get_hacluster_subordinate_pairs.return_value = {unit.name: ha for unit, ha in zip(units, units_ha)}
+
+        loop(perform_upgrade(model, app, {}, 'openstack-upgrade', {}, rollable=True, pause=True, origin=''))
+
+        self.assertNotIn(('openstack-upgrade',), [c[0] for c in units[0].run_action.mock.call_args_list])
+        units[0].run_action.mock.assert_called_with('resume')
+        units_ha[0].run_action.mock.assert_called_with('resume')
+        for unit in units[1:]:
+            unit.run_action.mock.assert_any_call('openstack-upgrade')
+            unit.run_action.mock.assert_called_with('resume')
+
+    def test_wait_until_settle(self):
+        """Testing units have to stay ready for the settle time."""
+        from jujuna.upgrade import wait_until
+
+        model = ModelMock()
+        unit = MagicMock(workload_status='active')
+        unit.name = 'glance/0'
+        app = MagicMock(status='active', units=[unit])
+        app.name = 'glance'
+        model.applications = {'glance': app}
+
+        def unit_data(workload):
+            return {'name': 'glance/0', 'application': 'glance', 'workload-status': {'current': workload}}
+
+        async def run():
+            waiter = asyncio.ensure_future(wait_until(model, [app], settle=0.2))
+            await asyncio.sleep(0.1)
+            self.assertFalse(waiter.done())
+            await model.change('unit', unit_data('maintenance'))
+            await asyncio.sleep(0.2)
+            self.assertFalse(waiter.done())
+            await model.change('unit', unit_data('active'))
+            await asyncio.sleep(0.1)
+            self.assertFalse(waiter.done())
+            await asyncio.wait_for(waiter, 1)
+
+        loop(run())
+
+    def test_wait_units_changed(self):
+        """Testing units react to the upgrade with a status transition."""
+        from jujuna.upgrade import wait_units_changed, agent_status_times
+
+        model = ModelMock()
+        units = [MagicMock(agent_status_since='t0'), MagicMock(agent_status_since='t0')]
+        for idx, unit in enumerate(units):
+            unit.name = 'glance/{}'.format(idx)
+        before = agent_status_times(units)
+
+        async def run():
+            waiter = asyncio.ensure_future(wait_units_changed(model, units, before, timeout=5))
+            await asyncio.sleep(0.01)
+            units[0].agent_status_since = 't1'
+            await model.change('unit')
+            self.assertFalse(waiter.done())
+            units[1].agent_status_since = 't1'
+            await model.change('unit')
+            return await asyncio.wait_for(waiter, 1)
+
+        self.assertTrue(loop(run()))
+        self.assertFalse(loop(wait_units_changed(model, units, agent_status_times(units), timeout=0.1)))
+        self.assertTrue(loop(wait_units_changed(model, [], {})))
+
+    def test_get_wait_scope(self):
+        """Testing applications waited for after upgrade."""
+        apps = {}
+        for name in ['nova', 'nova-ha', 'mysql', 'glance']:
+            apps[name] = MagicMock()
+            apps[name].name = name
+        apps['nova'].relations = [
+            MagicMock(is_subordinate=True, applications=[apps['nova'], apps['nova-ha']]),
+            MagicMock(is_subordinate=False, applications=[apps['mysql'], apps['nova']]),
+        ]
+        model = MagicMock(applications=apps)
+
+        self.assertEqual(get_wait_scope(model, apps['nova'], 'app'), [apps['nova'], apps['nova-ha']])
+        self.assertEqual(get_wait_scope(model, apps['nova']), [apps['nova'], apps['nova-ha'], apps['mysql']])
+        self.assertEqual(get_wait_scope(model, apps['nova'], 'model'), list(apps.values()))
+
+    def test_order_units(self):
+        """Testing leader discovery with a single status query."""
+        from jujuna.upgrade import order_units
+
+        def status_unit(leader, subordinates={}):
+            return MagicMock(leader=leader, subordinates=subordinates)
+
+        model = AsyncClassMock(static=['get_status'])
+        model.get_status.mock.return_value = MagicMock(applications={
+            'test': MagicMock(units={
+                'test/0': status_unit(False, {'test-ha/0': status_unit(True)}),
+                'test/1': status_unit(True, {'test-ha/1': status_unit(False)}),
+            }),
+            'other': MagicMock(units={'other/0': status_unit(False)}),
+        })
+        units = []
+        for idx in range(2):
+            unit = MagicMock(application='test', model=model)
+            unit.name = 'test/{}'.format(idx)
+            units.append(unit)
+
+        leaders = {}
+        ordered = loop(order_units('TEST', units, leaders=leaders))
+        self.assertEqual([unit.name for unit in ordered], ['test/1', 'test/0'])
+        self.assertEqual(leaders, {'test': ['test/1'], 'test-ha': ['test-ha/0'], 'other': []})
+
+        # cached leaders, ambiguous leadership keeps the order
+        ordered = loop(order_units('OTHER', [MagicMock(application='other')], leaders=leaders))
+        self.assertEqual(len(ordered), 1)
+        self.assertEqual(model.get_status.mock.call_count, 1)
+
+    def test_order_units_probes(self):
+        """Testing concurrent is-leader probes if status is not available."""
+        from jujuna.upgrade import order_units
+
+        model = AsyncClassMock(static=['get_status'])
+        model.get_status.mock.side_effect = Exception('status failed')
+        units = []
+        for idx in range(3):
+            unit = AsyncClassMock(static=['run'], props={
+                'name': 'test/{}'.format(idx), 'application': 'test', 'model': model
+            })
+            unit.run.mock.return_value = MagicMock(data={'results': {'Stdout': 'True\n' if idx == 2 else 'False\n'}})
+            units.append(unit)
+
+        ordered = loop(order_units('TEST', units))
+        self.assertEqual([unit.name for unit in ordered], ['test/2', 'test/0', 'test/1'])
+
+    @patch('jujuna.upgrade.wait_actions', new=wait_actions_mock)
+    @patch('asyncio.sleep', new=AsyncMock())
+    @patch('jujuna.upgrade.get_hacluster_subordinate_pairs', new=lambda app: {})
+    @patch('jujuna.upgrade.wait_until', new=AsyncMock())
+    @patch('jujuna.upgrade.wait_signal', new=AsyncMock(return_value=True))
+    @patch('jujuna.upgrade.order_units', new=AsyncMock())
+    @patch('jujuna.upgrade.enumerate_actions', new=AsyncMock(return_value=['openstack-upgrade']))
+    def test_perform_upgrade_resume(self):
+        """Testing finished steps are skipped and new ones recorded."""
+        from jujuna.upgrade import order_units
+
+        units = []
+        for idx in range(3):
+            unit = AsyncClassMock(
+                static=['run_action'], props={'name': 'test/{}'.format(idx), 'agent_status_since': None}
+            )
+            unit.run_action.mock.return_value = AsyncClassMock(static=['wait'], props={'status': 'completed'})
+            units.append(unit)
+        app = AsyncClassMock(
+            static=['set_config', 'get_config'], props={'name': 'test', 'units': units, 'relations': []}
+        )
+        model = AsyncClassMock(props={'applications': {'test': app}, 'loop': None})
+        order_units.mock.return_value = units
+        journal = MagicMock()
+        journal.done.side_effect = lambda kind, name: (kind, name) in [('config', 'test'), ('unit', 'test/0')]
+
+        loop(perform_upgrade(
+            model, app, {}, 'openstack-upgrade', {}, rollable=True, origin='cloud:xenial-ocata', journal=journal
+        ))
+        app.set_config.mock.assert_not_called()
+        units[0].run_action.mock.assert_not_called()
+        units[1].run_action.mock.assert_called_once_with('openstack-upgrade')
+        journal.record.assert_any_call('unit', 'test/1')
+        journal.record.assert_any_call('unit', 'test/2')
+
+    @patch('jujuna.upgrade.wait_actions', new=wait_actions_mock)
+    @patch('jujuna.upgrade.get_hacluster_subordinate_pairs', new=lambda app: {})
+    @patch('jujuna.upgrade.wait_until', new=AsyncMock())
+    @patch('jujuna.upgrade.wait_signal', new=AsyncMock(return_value=True))
+    @patch('jujuna.upgrade.order_units', new=AsyncMock())
+    @patch('jujuna.upgrade.is_rollable', new=AsyncMock(return_value=True))
+    @patch('jujuna.upgrade.enumerate_actions', new=AsyncMock(return_value=['openstack-upgrade']))
+    def test_upgrade_services_failed_unit(self):
+        """Testing application with failed units is not journaled as finished."""
+        from jujuna.upgrade import order_units, upgrade_services
+
+        units = []
+        for idx, status in enumerate(['completed', 'failed']):
+            unit = AsyncClassMock(
+                static=['run_action'], props={'name': 'test/{}'.format(idx), 'agent_status_since': None}
+            )
+            unit.run_action.mock.return_value = AsyncClassMock(static=['wait'], props={'status': status})
+            units.append(unit)
+        app = AsyncClassMock(
+            static=['get_actions'], props={'name': 'test', 'units': units, 'relations': [], 'safe_data': {}}
+        )
+        model = AsyncClassMock(props={'applications': {'test': app}, 'loop': None})
+        order_units.mock.return_value = units
+        journal = MagicMock()
+        journal.done.return_value = False
+        upgraded = []
+
+        loop(upgrade_services(
+            model, ['test'], '', {}, 'openstack-upgrade', {}, False, False, journal=journal,
+            on_upgraded=upgraded.append
+        ))
+        journal.record.assert_called_once_with('unit', 'test/0')
+        self.assertEqual(upgraded, ['test'])
+
+    @patch('jujuna.upgrade.wait_signal', new=AsyncMock(return_value=True))
+    def test_perform_bigbang_upgrade(self):
+        """Testing big-bang upgrade finishes on unit status change."""
+        model = ModelMock()
+        unit = MagicMock(workload_status='maintenance')
+        app = AsyncClassMock(
+            static=['set_config', 'get_config'], props={'name': 'test', 'units': [unit], 'model': model}
+        )
+        app.get_config.mock.return_value = {'openstack-origin': {'value': 'cloud:xenial-newton'}}
+
+        async def run():
+            upgrade = asyncio.ensure_future(perform_bigbang_upgrade(app, {}, origin='cloud:xenial-ocata'))
+            unit.workload_status = 'Upgrading'
+            await asyncio.sleep(0.01)
+            self.assertFalse(upgrade.done())
+            unit.workload_status = 'active'
+            await model.change('unit')
+            await asyncio.wait_for(upgrade, 1)
+
+        loop(run())
+        app.set_config.mock.assert_called_once_with({'openstack-origin': 'cloud:xenial-ocata'})
+
+    def test_action_catalog(self):
+        """Testing actions are fetched once per charm."""
+        from jujuna.upgrade import ActionCatalog, enumerate_actions
+
+        apps = []
+        for name, charm_url in [('a', 'cs:test-1'), ('b', 'cs:test-1'), ('c', 'cs:other-2')]:
+            app = AsyncClassMock(static=['get_actions'], props={
+                'name': name, 'safe_data': {'charm-url': charm_url}
+            })
+            app.get_actions.mock.return_value = {'pause': '', name: ''}
+            apps.append(app)
+
+        catalog = ActionCatalog()
+        loop(catalog.prefetch(apps))
+        self.assertEqual(list(loop(enumerate_actions(apps[1], catalog=catalog))), ['pause', 'a'])
+        apps[0].get_actions.mock.assert_called_once_with()
+        apps[1].get_actions.mock.assert_not_called()
+        apps[2].get_actions.mock.assert_called_once_with()
+
+    @patch('asyncio.sleep', new=AsyncMock())
+    @patch('jujuna.upgrade.client')
+    def test_wait_actions(self, client):
+        """Testing batched retrieval of action statuses."""
+        from jujuna.upgrade import wait_actions
+
+        responses = [
+            MagicMock(results=[
+                MagicMock(status='running', error=None),
+                MagicMock(status='completed', error=None),
+                MagicMock(status='aborted', error=None),
+            ]),
+            MagicMock(results=[MagicMock(status='failed', error=None)]),
+        ]
+        facade = AsyncClassMock(static=['Actions'])
+        facade.Actions.mock.side_effect = responses
+        client.ActionFacade.from_connection.return_value = facade
+
+        actions = [MagicMock(entity_id='1'), MagicMock(entity_id='2'), MagicMock(entity_id='3')]
+        statuses = loop(wait_actions(MagicMock(), actions))
+        self.assertEqual(statuses, ['failed', 'completed', 'aborted'])
+        facade.Actions.mock.assert_called_with(entities=[{'tag': 'action-1'}])
+        self.assertEqual(facade.Actions.mock.call_count, 2)
+        asyncio.sleep.mock.assert_called_once_with(0.5)
@@ -0,0 +1,175 @@
+"""
+Tests for waiting on model changes.
+
+"""
+
+import time
+import asyncio
+import unittest
+from unittest.mock import MagicMock, patch
+from .asyncio_mocks import loop
+from jujuna.wait import wait_for, wait_signal, model_status
+
+
+class ModelMock():
+
+    def __init__(self):
+        self.observers = []
+        self.connected = True
+        self.applications = {}
+
+    def add_observer(self, callable_, *args, **kwargs):
+        self.observers.append(callable_)
+
+    def is_connected(self):
+        return self.connected
+
+    def connection(self):
+        return MagicMock(is_open=True)
+
+    async def change(self, entity, data=None, type_='change'):
+        delta = MagicMock(entity=entity, data=data or {}, type=type_)
+        for observer in self.observers:
+            await observer(delta, None, None, self)
+
+
+class TestWait(unittest.TestCase):
+    """Test event driven waiting.
+
+    """
+
+    def test_wait_for_change(self):
+        """Testing condition evaluated on model changes only."""
+        model = ModelMock()
+        state = {'ready': False, 'checks': 0}
+
+        def condition():
+            state['checks'] += 1
+            return state['ready']
+
+        async def run():
+            waiter = asyncio.ensure_future(wait_for(model, condition, entity_types=['unit'], heartbeat=60))
+            await asyncio.sleep(0.01)
+            await model.change('machine')
+            await asyncio.sleep(0.01)
+            checks = state['checks']
+            state['ready'] = True
+            await model.change('unit')
+            return checks, await asyncio.wait_for(waiter, 1)
+
+        start = time.monotonic()
+        checks, ready = loop(run())
+        self.assertTrue(ready)
+        self.assertEqual(checks, 1)
+        self.assertEqual(state['checks'], 2)
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_wait_for_settle(self):
+        """Testing condition has to stay true."""
+        model = ModelMock()
+        start = time.monotonic()
+        self.assertTrue(loop(wait_for(model, lambda: True, settle=0.2, heartbeat=60)))
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+    def test_wait_for_disconnected(self):
+        """Testing disconnected model."""
+        model = ModelMock()
+        model.connected = False
+        self.assertFalse(loop(wait_for(model, lambda: False)))
+
+    def test_wait_signal(self):
+        """Testing signal with timeout fallback."""
+        model = ModelMock()
+        state = {'done': False}
+
+        async def run():
+            waiter = asyncio.ensure_future(wait_signal(model, lambda: state['done'], ['relation'], timeout=5))
+            await asyncio.sleep(0)
+            state['done'] = True
+            await model.change('relation')
+            return await waiter
+
+        self.assertTrue(loop(run()))
+        self.assertFalse(loop(wait_signal(model, lambda: False, timeout=0.1)))
+
+    def test_status_aggregator(self):
+        """Testing status tallies maintained from deltas."""
+        model = ModelMock()
+        unit = MagicMock(workload_status='maintenance')
+        unit.name = 'glance/0'
+        app = MagicMock(status='waiting', units=[unit])
+        app.name = 'glance'
+        model.applications = {'glance': app}
+        status = model_status(model)
+        self.assertEqual(status.workload_statuses(['glance']), {'maintenance': 1})
+
+        def unit_data(name, workload):
+            return {'name': name, 'application': 'glance', 'workload-status': {'current': workload}}
+
+        loop(model.change('unit', unit_data('glance/1', 'maintenance'), 'add'))
+        loop(model.change('unit', unit_data('glance/0', 'active')))
+        loop(model.change('application', {'name': 'glance', 'status': {'current': 'active'}}))
+        self.assertEqual(status.app_statuses(['glance', 'missing']), {'active': 1, 'none': 1})
+        self.assertEqual(status.workload_statuses(['glance']), {'active': 1, 'maintenance': 1})
+
+        loop(model.change('unit', unit_data('glance/1', 'maintenance'), 'remove'))
+        self.assertEqual(status.workload_statuses(['glance']), {'active': 1})
+
+        loop(model.change('application', {'name': 'glance'}, 'remove'))
+        self.assertEqual(status.app_statuses(['glance']), {'none': 1})
+        self.assertEqual(status.workload_statuses(['glance']), {})
+        loop(model.change('unit', unit_data('glance/0', 'active'), 'remove'))
+
+    def test_status_unset(self):
+        """Testing status of application without status derived from its units."""
+        model = ModelMock()
+        status = model_status(model)
+
+        def unit_data(name, workload):
+            return {'name': name, 'application': 'mysql', 'workload-status': {'current': workload}}
+
+        loop(model.change('application', {'name': 'mysql', 'status': {'current': 'unset'}}, 'add'))
+        loop(model.change('unit', unit_data('mysql/0', 'maintenance'), 'add'))
+        loop(model.change('unit', unit_data('mysql/1', 'active'), 'add'))
+        self.assertEqual(status.app_statuses(['mysql']), {'maintenance': 1})
+
+        loop(model.change('unit', unit_data('mysql/0', 'active')))
+        loop(model.change('application', {'name': 'mysql', 'status': {'current': 'unset'}}))
+        self.assertEqual(status.app_statuses(['mysql']), {'active': 1})
+
+        loop(model.change('application', {'name': 'mysql', 'status': {'current': 'blocked'}}))
+        loop(model.change('unit', unit_data('mysql/1', 'active')))
+        self.assertEqual(status.app_statuses(['mysql']), {'blocked': 1})
+
+    def test_status_time_in_state(self):
+        """Testing time in status and error timeout of apps stuck in error."""
+        from datetime import datetime, timedelta, timezone
+        from jujuna.helper import wait_until, ApperrorTimeout
+
+        model = ModelMock()
+        model.machines = {}
+        since = datetime.fromtimestamp(time.time() - 60, timezone(timedelta(hours=2))).isoformat()
+        for name, status in [('nova', 'error'), ('glance', 'blocked'), ('mysql', 'active')]:
+            app = MagicMock(status=status, status_message='', units=[], safe_data={
+                'status': {'since': since if name == 'nova' else None}
+            })
+            app.name = name
+            model.applications[name] = app
+        status = model_status(model)
+
+        self.assertGreaterEqual(status.time_in_state('nova'), 59)
+        self.assertLess(status.time_in_state('nova'), 70)
+        self.assertEqual([app[:2] for app in status.stuck(list(model.applications))], [
+            ('nova', 'error'), ('glance', 'blocked')
+        ])
+        loop(model.change('application', {'name': 'nova', 'status': {'current': 'error'}}))
+        self.assertGreaterEqual(status.time_in_state('nova'), 59)
+        loop(model.change('application', {'name': 'nova', 'status': {'current': 'active'}}))
+        self.assertLess(status.time_in_state('nova'), 1)
+        loop(model.change('application', {'name': 'nova', 'status': {'current': 'error'}}))
+
+        monotonic = time.monotonic
+        with patch('time.monotonic', new=lambda: monotonic() + 30):
+            self.assertGreaterEqual(status.time_in_state('nova'), 30)
+            with self.assertRaises(ApperrorTimeout):
+                loop(wait_until(model, list(model.applications.values()), MagicMock(), error_timeout=20))